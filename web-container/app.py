@@ -1,10 +1,46 @@
+import gzip
+import hashlib
+import json
 import logging
-from flask import Flask, render_template, request, jsonify
+import sys
+import time
+import traceback
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import wraps
+from flask import Flask, Response, g, render_template, request, jsonify
 import requests
 import os
+import random
+import re
+import shutil
+import threading
+import unicodedata
+import zlib
+import numpy as np
+from requests.adapters import HTTPAdapter
 from requests.utils import quote as url_quote
+from urllib3.exceptions import NewConnectionError
 from dotenv import load_dotenv
 
+try:
+    import redis
+except ImportError:  # cache compartilhado é opcional
+    redis = None
+
+try:
+    import fcntl
+except ImportError:  # fora do Unix não há vários workers disputando o diretório
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # sem brotli, as respostas saem só em gzip
+    brotli = None
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
@@ -18,6 +54,379 @@ logger = logging.getLogger(__name__)
 WHATSAPP_NUMERO = os.getenv("WHATSAPP_NUMERO", "551199887766")
 WHATSAPP_LINK = f"https://wa.me/{WHATSAPP_NUMERO}?text="
 
+# === CONFIGURAÇÕES DO LLM ===
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+LLM_MODELO = os.getenv("LLM_MODELO", "llama3-8b-8192")
+LLM_POOL_CONEXOES = int(os.getenv("LLM_POOL_CONEXOES", 10))
+LLM_MAX_CONCORRENCIA = int(os.getenv("LLM_MAX_CONCORRENCIA", 8))
+LLM_TIMEOUT_CONEXAO = float(os.getenv("LLM_TIMEOUT_CONEXAO", 3.05))
+LLM_TIMEOUT_LEITURA = float(os.getenv("LLM_TIMEOUT_LEITURA", 30))
+LLM_TENTATIVAS = int(os.getenv("LLM_TENTATIVAS", 2))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", 0.3))
+
+# === BACKENDS DO LLM (ordem de preferência; groq exige GROQ_API_KEY, ollama exige OLLAMA_BASE_URL) ===
+LLM_BACKENDS = [b.strip() for b in os.getenv("LLM_BACKENDS", "groq,ollama").split(",") if b.strip()]
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "").rstrip("/")
+OLLAMA_MODELO = os.getenv("OLLAMA_MODELO", "tinyllama:1.1b")
+LLM_HEDGE_MS = float(os.getenv("LLM_HEDGE_MS", 1500))  # 0 desativa o pedido de reserva
+
+# === ADMISSÃO E DISJUNTOR DO LLM ===
+LLM_MAX_FILA = int(os.getenv("LLM_MAX_FILA", 16))
+LLM_ESPERA_MAX_FILA = float(os.getenv("LLM_ESPERA_MAX_FILA", 2.0))
+LLM_PRAZO = float(os.getenv("LLM_PRAZO", 20))
+LLM_DISJUNTOR_FALHAS = int(os.getenv("LLM_DISJUNTOR_FALHAS", 5))
+LLM_DISJUNTOR_RESFRIAMENTO = float(os.getenv("LLM_DISJUNTOR_RESFRIAMENTO", 30))
+
+# === CONFIGURAÇÕES DO CACHE DE RESPOSTAS ===
+CACHE_MAX_ITENS = int(os.getenv("CACHE_MAX_ITENS", 1000))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 5_000_000))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 3600))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+
+# === CONFIGURAÇÕES DO FAQ (respostas prontas por similaridade) ===
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+FAQ_ARQUIVO = os.getenv("FAQ_ARQUIVO", os.path.join(DIRETORIO_APP, "faq.json"))
+FAQ_INDICE_DIR = os.getenv("FAQ_INDICE_DIR", os.path.join(DIRETORIO_APP, "faq_indice"))
+FAQ_LIMIAR = float(os.getenv("FAQ_LIMIAR", 0.5))
+
+# === CONFIGURAÇÕES DE MÉTRICAS E PERFIL ===
+METRICAS_DIR = os.getenv("METRICAS_DIR", "")  # diretório comum aos workers do gunicorn
+METRICAS_INTERVALO = float(os.getenv("METRICAS_INTERVALO", 5))
+PERFIL_LENTO_MS = float(os.getenv("PERFIL_LENTO_MS", 0))  # 0 desativa o perfil
+PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", 5))
+PERFIL_DIR = os.getenv("PERFIL_DIR", "")
+
+# === CONFIGURAÇÕES DE COMPRESSÃO ===
+COMPRESSAO_MIN_BYTES = int(os.getenv("COMPRESSAO_MIN_BYTES", 512))  # corpos menores saem sem compressão
+PAGINA_CACHE_CONTROL = "public, no-cache"  # o navegador guarda a página, mas revalida pelo ETag
+
+# === MÉTRICAS (formato texto do Prometheus) ===
+# Contadores, medidores e histogramas em memória, protegidos por um único lock
+# com seções críticas mínimas. Com METRICAS_DIR, cada processo grava
+# periodicamente um instantâneo em metricas-<pid>.json e o /metrics soma os
+# instantâneos de todos os workers (medidores só dos processos vivos). Os
+# contadores e histogramas de workers que já terminaram são somados uma única
+# vez em encerrados.json e o arquivo deles é apagado.
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_DETECCAO = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+
+class Metricas:
+    def __init__(self, diretorio: str = "", intervalo: float = 5.0):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._tipos: dict[str, tuple[str, str]] = {}
+        self._buckets: dict[str, tuple[float, ...]] = {}
+        self._valores: dict[tuple[str, tuple], float] = {}
+        self._histogramas: dict[tuple[str, tuple], list[float]] = {}
+        self._coletores = []
+        self._gravador_pid = None
+
+    def contador(self, nome: str, ajuda: str):
+        self._tipos[nome] = ("counter", ajuda)
+
+    def medidor(self, nome: str, ajuda: str):
+        self._tipos[nome] = ("gauge", ajuda)
+
+    def histograma(self, nome: str, ajuda: str, buckets: tuple[float, ...] = BUCKETS_SEGUNDOS):
+        self._tipos[nome] = ("histogram", ajuda)
+        self._buckets[nome] = buckets
+
+    # Soma `valor` a um contador ou medidor (negativo só faz sentido em medidor)
+    def incrementar(self, nome: str, valor: float = 1.0, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        buckets = self._buckets[nome]
+        posicao = bisect_left(buckets, valor)
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                # contagem por bucket (não cumulativa), +Inf e soma
+                histograma = self._histogramas[chave] = [0] * (len(buckets) + 1) + [0.0]
+            histograma[posicao] += 1
+            histograma[-1] += valor
+
+    @contextmanager
+    def em_andamento(self, nome: str, **rotulos):
+        self.incrementar(nome, 1, **rotulos)
+        try:
+            yield
+        finally:
+            self.incrementar(nome, -1, **rotulos)
+
+    # Coletores devolvem [(nome, rótulos, valor)] com valores absolutos, lidos
+    # só na hora de exportar (estatísticas que já existem em outros objetos)
+    def registrar_coletor(self, coletor):
+        self._coletores.append(coletor)
+
+    def instantaneo(self) -> dict:
+        with self._lock:
+            valores = dict(self._valores)
+            histogramas = {chave: list(h) for chave, h in self._histogramas.items()}
+        for coletor in self._coletores:
+            try:
+                for nome, rotulos, valor in coletor():
+                    valores[(nome, tuple(sorted(rotulos.items())))] = float(valor)
+            except Exception as e:
+                logger.warning(f"Coletor de métricas falhou: {e}")
+        return {
+            "pid": os.getpid(),
+            "valores": [[nome, rotulos, valor] for (nome, rotulos), valor in valores.items()],
+            "histogramas": [[nome, rotulos, h] for (nome, rotulos), h in histogramas.items()],
+        }
+
+    def _gravar(self):
+        instantaneo = self.instantaneo()
+        self._gravar_json(os.path.join(self.diretorio, f"metricas-{instantaneo['pid']}.json"), instantaneo)
+
+    def _loop_gravacao(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self._gravar()
+            except Exception as e:
+                logger.warning(f"Falha ao gravar métricas: {e}")
+
+    # Inicia o gravador neste processo (depois do fork dos workers). Um arquivo
+    # com o nosso PID é de um processo anterior que teve o PID reaproveitado:
+    # é incorporado antes de ser sobrescrito.
+    def garantir_gravador(self):
+        if not self.diretorio or self._gravador_pid == os.getpid():
+            return
+        self._gravador_pid = os.getpid()
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._incorporar_encerrados([f"metricas-{os.getpid()}.json"])
+        threading.Thread(target=self._loop_gravacao, name="metricas", daemon=True).start()
+
+    @staticmethod
+    def _processo_vivo(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def _pid_do_arquivo(arquivo: str) -> int | None:
+        if not (arquivo.startswith("metricas-") and arquivo.endswith(".json")):
+            return None
+        pid = arquivo[len("metricas-"):-len(".json")]
+        return int(pid) if pid.isdigit() else None
+
+    @staticmethod
+    def _ler_json(caminho: str) -> dict | None:
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _gravar_json(caminho: str, dados: dict):
+        with open(f"{caminho}.tmp", "w", encoding="utf-8") as f:
+            json.dump(dados, f)
+        os.replace(f"{caminho}.tmp", caminho)
+
+    # Soma contadores e histogramas dos arquivos em encerrados.json e apaga os
+    # arquivos. O flock impede que dois workers incorporem o mesmo arquivo.
+    def _incorporar_encerrados(self, arquivos: list[str]):
+        if not arquivos:
+            return
+        with open(os.path.join(self.diretorio, "encerrados.lock"), "a") as trava:
+            if fcntl:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            caminhos = [os.path.join(self.diretorio, a) for a in arquivos]
+            caminhos = [c for c in caminhos if os.path.exists(c)]
+            if not caminhos:
+                return
+            destino = os.path.join(self.diretorio, "encerrados.json")
+            agregado = self._ler_json(destino) or {"pid": None, "valores": [], "histogramas": []}
+            valores = {(nome, tuple(tuple(r) for r in rotulos)): v for nome, rotulos, v in agregado["valores"]}
+            histogramas = {(nome, tuple(tuple(r) for r in rotulos)): h for nome, rotulos, h in agregado["histogramas"]}
+            for caminho in caminhos:
+                inst = self._ler_json(caminho) or {"valores": [], "histogramas": []}
+                for nome, rotulos, valor in inst["valores"]:
+                    if self._tipos.get(nome, ("gauge",))[0] == "gauge":
+                        continue
+                    chave = (nome, tuple(tuple(r) for r in rotulos))
+                    valores[chave] = valores.get(chave, 0.0) + valor
+                for nome, rotulos, h in inst["histogramas"]:
+                    chave = (nome, tuple(tuple(r) for r in rotulos))
+                    atual = histogramas.setdefault(chave, [0] * len(h))
+                    for i, v in enumerate(h):
+                        atual[i] += v
+            self._gravar_json(destino, {
+                "pid": None,
+                "valores": [[nome, rotulos, v] for (nome, rotulos), v in valores.items()],
+                "histogramas": [[nome, rotulos, h] for (nome, rotulos), h in histogramas.items()],
+            })
+            for caminho in caminhos:
+                os.remove(caminho)
+
+    def _instantaneos(self) -> list[dict]:
+        if not self.diretorio:
+            return [self.instantaneo()]
+        self.garantir_gravador()
+        self._gravar()
+        encerrados = []
+        for arquivo in os.listdir(self.diretorio):
+            pid = self._pid_do_arquivo(arquivo)
+            if pid is not None and pid != os.getpid() and not self._processo_vivo(pid):
+                encerrados.append(arquivo)
+        self._incorporar_encerrados(encerrados)
+        instantaneos = []
+        for arquivo in os.listdir(self.diretorio):
+            if arquivo == "encerrados.json" or self._pid_do_arquivo(arquivo) is not None:
+                inst = self._ler_json(os.path.join(self.diretorio, arquivo))
+                if inst is not None:
+                    instantaneos.append(inst)
+        return instantaneos
+
+    @staticmethod
+    def _rotulos(rotulos, extra: tuple = ()) -> str:
+        pares = [*rotulos, *extra]
+        if not pares:
+            return ""
+        escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # noqa: E731
+        return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+    def exportar(self) -> str:
+        valores: dict[tuple[str, tuple], float] = {}
+        histogramas: dict[tuple[str, tuple], list[float]] = {}
+        for inst in self._instantaneos():
+            vivo = inst["pid"] is not None and (inst["pid"] == os.getpid() or self._processo_vivo(inst["pid"]))
+            for nome, rotulos, valor in inst["valores"]:
+                if self._tipos.get(nome, ("gauge",))[0] == "gauge" and not vivo:
+                    continue
+                chave = (nome, tuple(tuple(r) for r in rotulos))
+                valores[chave] = valores.get(chave, 0.0) + valor
+            for nome, rotulos, h in inst["histogramas"]:
+                chave = (nome, tuple(tuple(r) for r in rotulos))
+                atual = histogramas.setdefault(chave, [0] * len(h))
+                for i, v in enumerate(h):
+                    atual[i] += v
+
+        linhas = []
+        for nome, (tipo, ajuda) in sorted(self._tipos.items()):
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            if tipo != "histogram":
+                for (n, rotulos), valor in sorted(valores.items()):
+                    if n == nome:
+                        linhas.append(f"{nome}{self._rotulos(rotulos)} {valor:g}")
+                continue
+            buckets = self._buckets[nome]
+            for (n, rotulos), h in sorted(histogramas.items()):
+                if n != nome:
+                    continue
+                acumulado = 0
+                for limite, contagem in zip((*buckets, "+Inf"), h[:-1]):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{self._rotulos(rotulos, (('le', limite),))} {acumulado:g}")
+                linhas.append(f"{nome}_sum{self._rotulos(rotulos)} {h[-1]:g}")
+                linhas.append(f"{nome}_count{self._rotulos(rotulos)} {acumulado:g}")
+        return "\n".join(linhas) + "\n"
+
+metricas = Metricas(METRICAS_DIR, METRICAS_INTERVALO)
+metricas.contador("drlegal_chat_respostas_total", "Respostas do chat por rota e ramo")
+metricas.histograma("drlegal_chat_duracao_segundos", "Duração das requisições do chat por rota e ramo")
+metricas.medidor("drlegal_chat_em_andamento", "Requisições do chat em andamento")
+metricas.histograma("drlegal_deteccao_duracao_segundos", "Duração da detecção de termos", BUCKETS_DETECCAO)
+metricas.histograma("drlegal_llm_duracao_segundos", "Duração das chamadas ao upstream do LLM")
+metricas.contador("drlegal_llm_respostas_total", "Respostas do upstream do LLM por status HTTP")
+metricas.contador("drlegal_llm_erros_total", "Erros nas chamadas ao upstream do LLM por tipo")
+metricas.medidor("drlegal_llm_em_andamento", "Chamadas ao upstream do LLM em andamento")
+
+# === PERFIL POR AMOSTRAGEM DAS REQUISIÇÕES LENTAS (opcional) ===
+# Com PERFIL_LENTO_MS > 0, uma thread tira a pilha de cada thread que está
+# atendendo requisição (e das threads do executor do LLM vinculadas a ela) a
+# cada PERFIL_INTERVALO_MS. Requisições mais lentas que
+# o limiar têm as pilhas mais frequentes registradas no log (e, com
+# PERFIL_DIR, em formato "folded" para flamegraph); as demais são descartadas.
+class AmostradorPerfil:
+    def __init__(self, limiar: float, intervalo: float, diretorio: str = ""):
+        self.limiar = limiar
+        self.intervalo = intervalo
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self._amostras: dict[int, Counter] = {}
+        self._thread_pid = None
+
+    def _garantir_thread(self):
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._loop, name="perfil", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.intervalo)
+            with self._lock:
+                ativas = list(self._amostras.items())
+            if not ativas:
+                continue
+            quadros = sys._current_frames()
+            for ident, contagem in ativas:
+                quadro = quadros.get(ident)
+                if quadro is not None:
+                    pilha = ";".join(f"{os.path.basename(q.filename)}:{q.name}:{q.lineno}"
+                                     for q in traceback.extract_stack(quadro, limit=40))
+                    # Sob o lock: finalizar() copia as amostras com ele
+                    with self._lock:
+                        contagem[pilha] += 1
+
+    # Amostras da requisição atendida pela thread atual, se houver
+    def atual(self) -> Counter | None:
+        with self._lock:
+            return self._amostras.get(threading.get_ident())
+
+    # Enquanto durar o bloco, a thread atual é amostrada junto com a
+    # requisição dona de `contagem`
+    @contextmanager
+    def vinculado(self, contagem: Counter | None):
+        if contagem is None:
+            yield
+            return
+        ident = threading.get_ident()
+        with self._lock:
+            self._amostras[ident] = contagem
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._amostras.get(ident) is contagem:
+                    del self._amostras[ident]
+
+    # Devolve as amostras da requisição, a passar para finalizar(); quem
+    # encerra pode ser outra thread (o fim de um streaming, por exemplo)
+    def iniciar(self) -> Counter:
+        self._garantir_thread()
+        contagem = Counter()
+        with self._lock:
+            self._amostras[threading.get_ident()] = contagem
+        return contagem
+
+    def finalizar(self, contagem: Counter, duracao: float, descricao: str):
+        with self._lock:
+            self._amostras = {t: c for t, c in self._amostras.items() if c is not contagem}
+            contagem = Counter(dict(contagem))
+        if not contagem or duracao < self.limiar:
+            return
+        total = sum(contagem.values())
+        topo = "\n".join(f"  {n:>4}/{total} {pilha.rsplit(';', 4)[-4:]}" for pilha, n in contagem.most_common(5))
+        logger.warning(f"Requisição lenta ({duracao * 1000:.0f} ms) {descricao}; pilhas mais frequentes:\n{topo}")
+        if self.diretorio:
+            os.makedirs(self.diretorio, exist_ok=True)
+            with open(os.path.join(self.diretorio, f"perfil-{os.getpid()}.folded"), "a", encoding="utf-8") as f:
+                f.writelines(f"{pilha} {n}\n" for pilha, n in contagem.items())
+
+amostrador_perfil = AmostradorPerfil(PERFIL_LENTO_MS / 1000, PERFIL_INTERVALO_MS / 1000, PERFIL_DIR) if PERFIL_LENTO_MS > 0 else None
+
 # === PALAVRAS-JURÍDICAS POR ÁREA (abrangente) ===
 PALAVRAS_JURIDICAS = {
     "Direito de Família": ["divórcio", "guarda", "alimentos", "casamento", "união estável", "pensão", "pensão alimentícia", "filho", "criança", "separação", "herança familiar"],
@@ -33,41 +442,375 @@ PALAVRAS_JURIDICAS = {
     "Geral": ["lei", "direito", "advogado", "justiça", "direitos", "processo", "ação", "juiz"]
 }
 
+# === SAUDAÇÕES, DESPEDIDAS E TEMAS COMUNS ===
+SAUDACOES = ["oi", "olá", "bom dia", "boa tarde"]
+DESPEDIDAS = ["tchau", "obrigado", "valeu"]
+
+# Temas comuns (respostas rápidas)
+TEMAS = {
+    "divórcio": "Temos especialistas em divórcio rápido, consensual ou litigioso.",
+    "trabalho": "Podemos te ajudar com direitos trabalhistas e verbas rescisórias.",
+    "pix": "Errou no PIX? Temos ações para tentar recuperar seu dinheiro.",
+    "acidente": "Se foi vítima de acidente, você pode ter direito a indenização.",
+    "inss": "Problema com aposentadoria ou auxílio? Podemos revisar seu caso."
+}
+
+GRUPO_SAUDACAO = "_saudacao"
+GRUPO_DESPEDIDA = "_despedida"
+GRUPO_TEMA = "_tema"
+
+# === ÍNDICE DE TERMOS (montado uma vez na inicialização) ===
+_PALAVRA_RE = re.compile(r"\w+")
+
+# Minúsculas, sem acentos e quebrado em palavras ("Divórcio!" -> ["divorcio"])
+def normalizar_tokens(texto: str) -> list[str]:
+    sem_acento = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("ascii")
+    return _PALAVRA_RE.findall(sem_acento)
+
+# Casa todos os termos de todos os grupos em uma única passada pelo texto.
+# Cada termo vira uma chave de palavras normalizadas; a busca percorre as palavras
+# do texto uma vez e consulta um dicionário com os n-gramas que começam em cada
+# posição. O custo depende do tamanho do texto, não do tamanho do vocabulário,
+# e só casa palavras inteiras ("ir" não casa em "tirar", "mei" em "meio").
+class IndiceTermos:
+
+    def __init__(self, grupos: dict[str, list[str]]):
+        self._indice: dict[str, list[tuple[str, str]]] = {}
+        self._iniciais: set[str] = set()
+        self._max_palavras = 1
+        for grupo, termos in grupos.items():
+            for termo in termos:
+                tokens = normalizar_tokens(termo)
+                if not tokens:
+                    continue
+                entradas = self._indice.setdefault(" ".join(tokens), [])
+                if (grupo, termo) not in entradas:
+                    entradas.append((grupo, termo))
+                self._iniciais.add(tokens[0])
+                self._max_palavras = max(self._max_palavras, len(tokens))
+
+    # Retorna {grupo: {termos encontrados}} apenas para os grupos com acerto
+    def buscar(self, texto: str) -> dict[str, set[str]]:
+        tokens = normalizar_tokens(texto)
+        acertos: dict[str, set[str]] = {}
+        total = len(tokens)
+        for i, token in enumerate(tokens):
+            if token not in self._iniciais:
+                continue
+            chave = token
+            for j in range(i, min(i + self._max_palavras, total)):
+                if j > i:
+                    chave = f"{chave} {tokens[j]}"
+                for grupo, termo in self._indice.get(chave, ()):
+                    acertos.setdefault(grupo, set()).add(termo)
+        return acertos
+
+INDICE_TERMOS = IndiceTermos({
+    **PALAVRAS_JURIDICAS,
+    GRUPO_SAUDACAO: SAUDACOES,
+    GRUPO_DESPEDIDA: DESPEDIDAS,
+    GRUPO_TEMA: list(TEMAS),
+})
+
+def detectar_termos(pergunta: str) -> dict[str, set[str]]:
+    inicio = time.perf_counter()
+    acertos = INDICE_TERMOS.buscar(pergunta)
+    metricas.observar("drlegal_deteccao_duracao_segundos", time.perf_counter() - inicio)
+    return acertos
+
 # === FUNÇÕES DE DETECÇÃO ===
-def eh_tema_juridico(pergunta: str) -> bool:
-    p = pergunta.lower()
-    return any(palavra in p for area in PALAVRAS_JURIDICAS.values() for palavra in area)
+def eh_tema_juridico(pergunta: str, acertos: dict[str, set[str]] | None = None) -> bool:
+    if acertos is None:
+        acertos = detectar_termos(pergunta)
+    return any(area in acertos for area in PALAVRAS_JURIDICAS)
 
-def detectar_area(pergunta: str) -> str:
-    p = pergunta.lower()
+def detectar_area(pergunta: str, acertos: dict[str, set[str]] | None = None) -> str:
+    if acertos is None:
+        acertos = detectar_termos(pergunta)
     melhor_area = "Jurídico Geral"
     max_count = 0
-    for area, palavras in PALAVRAS_JURIDICAS.items():
-        count = sum(1 for palavra in palavras if palavra in p)
+    for area in PALAVRAS_JURIDICAS:
+        count = len(acertos.get(area, ()))
         if count > max_count:
             max_count = count
             melhor_area = area
     return melhor_area
 
+def tema_comum(acertos: dict[str, set[str]]) -> str | None:
+    encontrados = acertos.get(GRUPO_TEMA, ())
+    return next((tema for tema in TEMAS if tema in encontrados), None)
+
 # === BOTÃO WHATSAPP ===
 def botao_whatsapp(texto: str, mensagem: str) -> str:
     msg = url_quote(mensagem)
     return f'<a href="{WHATSAPP_LINK}{msg}" style="background:#1a3a6e; color:white; padding:12px 18px; border-radius:8px; text-decoration:none; font-weight:bold; display:inline-block; margin-top:10px;">📞 {texto}</a>'
 
-# === CHAMADA À GROQ (LLAMA 3) – COM PROMPT HUMANIZADO ===
-def perguntar(pergunta: str) -> dict | None:
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        logger.error("GROQ_API_KEY não configurada")
-        return None
+# === CONTROLE DE ADMISSÃO (fila limitada + prazo por requisição) ===
+class LLMIndisponivel(Exception):
+    pass
+
+# No máximo `max_concorrencia` chamadas em andamento e `max_fila` esperando.
+# Quem encontra a fila cheia, ou não consegue vaga dentro da espera máxima (ou
+# do prazo da própria requisição), é recusado na hora e vai para o fallback,
+# em vez de prender uma thread do Flask esperando o upstream.
+class ControleAdmissao:
+    def __init__(self, max_concorrencia: int, max_fila: int, espera_max: float):
+        self.max_concorrencia = max_concorrencia
+        self.max_fila = max_fila
+        self.espera_max = espera_max
+        self._cond = threading.Condition()
+        self._ativas = 0
+        self._na_fila = 0
+        self.contadores = {"admitidas": 0, "recusadas_fila_cheia": 0, "recusadas_espera": 0}
+
+    def entrar(self, prazo: float):
+        limite = min(prazo, time.monotonic() + self.espera_max)
+        with self._cond:
+            if self._ativas >= self.max_concorrencia:
+                if self._na_fila >= self.max_fila:
+                    self.contadores["recusadas_fila_cheia"] += 1
+                    raise LLMIndisponivel("fila do LLM cheia")
+                self._na_fila += 1
+                try:
+                    while self._ativas >= self.max_concorrencia:
+                        restante = limite - time.monotonic()
+                        if restante <= 0:
+                            self.contadores["recusadas_espera"] += 1
+                            raise LLMIndisponivel("tempo máximo de espera na fila do LLM esgotado")
+                        self._cond.wait(restante)
+                finally:
+                    self._na_fila -= 1
+            self._ativas += 1
+            self.contadores["admitidas"] += 1
+
+    def sair(self):
+        with self._cond:
+            self._ativas -= 1
+            self._cond.notify()
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            return {**self.contadores, "ativas": self._ativas, "na_fila": self._na_fila}
+
+# === DISJUNTOR (circuit breaker) ===
+# Depois de `falhas_max` falhas seguidas do upstream, abre por `resfriamento`
+# segundos: todas as perguntas vão direto para o fallback. Passado o tempo,
+# deixa uma única chamada de teste passar; sucesso fecha, falha reabre.
+class Disjuntor:
+    def __init__(self, falhas_max: int, resfriamento: float):
+        self.falhas_max = falhas_max
+        self.resfriamento = resfriamento
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+        self.contadores = {"aberturas": 0, "recusadas": 0}
+
+    # Devolve True quando esta chamada é a de teste (disjuntor meio-aberto)
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._falhas < self.falhas_max:
+                return False
+            if time.monotonic() < self._aberto_ate or self._testando:
+                self.contadores["recusadas"] += 1
+                raise LLMIndisponivel("disjuntor do LLM aberto")
+            self._testando = True
+            return True
+
+    # A chamada de teste nem chegou ao upstream (ex.: recusada pela fila)
+    def cancelar_teste(self):
+        with self._lock:
+            self._testando = False
+
+    def sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._testando = False
+            if self._falhas >= self.falhas_max:
+                self._aberto_ate = time.monotonic() + self.resfriamento
+                self.contadores["aberturas"] += 1
+                logger.warning(f"Disjuntor do LLM aberto por {self.resfriamento:.0f}s após {self._falhas} falhas seguidas")
+
+    def estado(self) -> str:
+        with self._lock:
+            if self._falhas < self.falhas_max:
+                return "fechado"
+            return "aberto" if time.monotonic() < self._aberto_ate else "meio-aberto"
+
+# === CLIENTE HTTP DO LLM (pool keep-alive + admissão + disjuntor) ===
+class ClienteLLM:
+    # Só repete o que é seguro repetir: falhas de conexão (a requisição não
+    # chegou ao servidor) e 429/503, em que o servidor recusou sem processar.
+    # Erros de leitura não são repetidos: a geração pode já ter acontecido.
+    STATUS_REPETIR = (429, 503)
+
+    def __init__(self, nome: str, base_url: str, pool: int, admissao: ControleAdmissao,
+                 disjuntor: Disjuntor, timeout_conexao: float, timeout_leitura: float,
+                 prazo: float, tentativas: int, backoff: float):
+        self.nome = nome
+        self.base_url = base_url
+        self.admissao = admissao
+        self.disjuntor = disjuntor
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        self.prazo = prazo
+        self.tentativas = tentativas
+        self.backoff = backoff
+        # As novas tentativas ficam a cargo de _enviar, que respeita o prazo
+        # da requisição; o adapter não repete nada sozinho
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def estatisticas(self) -> dict:
+        return {**self.admissao.estatisticas(), **self.disjuntor.contadores, "disjuntor": self.disjuntor.estado()}
+
+    # Passa pelo disjuntor e pela fila; devolve o prazo absoluto da chamada
+    def _admitir(self, prazo: float | None) -> float:
+        teste = self.disjuntor.permitir()
+        prazo = prazo if prazo is not None else time.monotonic() + self.prazo
+        try:
+            self.admissao.entrar(prazo)
+        except LLMIndisponivel:
+            if teste:
+                self.disjuntor.cancelar_teste()
+            raise
+        return prazo
+
+    # Timeout de uma tentativa, limitado ao que sobra do prazo
+    def _timeout(self, prazo: float) -> tuple[float, float]:
+        restante = max(0.1, prazo - time.monotonic())
+        return (min(self.timeout_conexao, restante), min(self.timeout_leitura, restante))
+
+    @staticmethod
+    def _falha_de_conexao(erro: requests.ConnectionError) -> bool:
+        if isinstance(erro, requests.ConnectTimeout):
+            return True
+        motivo = getattr(erro.args[0], "reason", None) if erro.args else None
+        return isinstance(motivo, NewConnectionError)
+
+    @staticmethod
+    def _retry_after(resp: requests.Response) -> float:
+        try:
+            return max(0.0, float(resp.headers.get("Retry-After", 0)))
+        except ValueError:  # formato de data HTTP: usa só o backoff
+            return 0.0
+
+    # Espera antes da próxima tentativa; devolve False quando não há mais
+    # tentativas ou a espera (backoff ou Retry-After) estouraria o prazo
+    def _esperar_nova_tentativa(self, tentativa: int, prazo: float, minimo: float = 0.0) -> bool:
+        if tentativa >= self.tentativas:
+            return False
+        espera = max(minimo, self.backoff * (2 ** tentativa) + random.uniform(0, self.backoff))
+        if time.monotonic() + espera + 0.1 >= prazo:
+            return False
+        time.sleep(espera)
+        return True
+
+    def _enviar(self, caminho: str, prazo: float, **kwargs) -> requests.Response:
+        tentativa = 0
+        while True:
+            try:
+                resp = self.session.post(f"{self.base_url}{caminho}", timeout=self._timeout(prazo), **kwargs)
+            except requests.ConnectionError as e:
+                if not self._falha_de_conexao(e) or not self._esperar_nova_tentativa(tentativa, prazo):
+                    raise
+            else:
+                if (resp.status_code not in self.STATUS_REPETIR
+                        or not self._esperar_nova_tentativa(tentativa, prazo, self._retry_after(resp))):
+                    return resp
+                resp.close()
+            tentativa += 1
+
+    @staticmethod
+    def _upstream_ok(resp: requests.Response) -> bool:
+        return resp.status_code < 500 and resp.status_code != 429
+
+    def _registrar(self, ok: bool):
+        if ok:
+            self.disjuntor.sucesso()
+        else:
+            self.disjuntor.falha()
+
+    # Métricas do upstream: duração, status HTTP, erros e chamadas em andamento
+    @contextmanager
+    def _medir_upstream(self):
+        inicio = time.perf_counter()
+        try:
+            with metricas.em_andamento("drlegal_llm_em_andamento", backend=self.nome):
+                yield
+        except Exception as e:
+            metricas.incrementar("drlegal_llm_erros_total", backend=self.nome, tipo=type(e).__name__)
+            raise
+        finally:
+            metricas.observar("drlegal_llm_duracao_segundos", time.perf_counter() - inicio, backend=self.nome)
+
+    def _contar_status(self, resp: requests.Response):
+        metricas.incrementar("drlegal_llm_respostas_total", backend=self.nome, status=str(resp.status_code))
+
+    def post(self, caminho: str, prazo: float | None = None, **kwargs) -> requests.Response:
+        prazo = self._admitir(prazo)
+        ok = False
+        try:
+            with self._medir_upstream():
+                resp = self._enviar(caminho, prazo, **kwargs)
+            self._contar_status(resp)
+            ok = self._upstream_ok(resp)
+            return resp
+        finally:
+            self._registrar(ok)
+            self.admissao.sair()
+
+    # Versão em streaming: a vaga fica ocupada até a resposta terminar (ou o
+    # gerador ser fechado, por exemplo quando o navegador desconecta)
+    def linhas(self, caminho: str, prazo: float | None = None, **kwargs):
+        prazo = self._admitir(prazo)
+        ok = False
+        try:
+            with self._medir_upstream(), self._enviar(caminho, prazo, stream=True, **kwargs) as resp:
+                self._contar_status(resp)
+                ok = self._upstream_ok(resp)
+                resp.raise_for_status()
+                # SSE/NDJSON vêm em UTF-8; sem isso o requests assume ISO-8859-1
+                # para text/* sem charset (ou nem decodifica)
+                resp.encoding = "utf-8"
+                try:
+                    for linha in resp.iter_lines(decode_unicode=True):
+                        if linha:
+                            yield linha
+                except Exception:
+                    # Conexão caiu no meio da resposta. Fechamento pelo navegador
+                    # (GeneratorExit) não conta como falha do upstream.
+                    ok = False
+                    raise
+        finally:
+            self._registrar(ok)
+            self.admissao.sair()
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+def novo_cliente_llm(nome: str, base_url: str) -> ClienteLLM:
+    return ClienteLLM(
+        nome=nome,
+        base_url=base_url,
+        pool=LLM_POOL_CONEXOES,
+        admissao=ControleAdmissao(LLM_MAX_CONCORRENCIA, LLM_MAX_FILA, LLM_ESPERA_MAX_FILA),
+        disjuntor=Disjuntor(LLM_DISJUNTOR_FALHAS, LLM_DISJUNTOR_RESFRIAMENTO),
+        timeout_conexao=LLM_TIMEOUT_CONEXAO,
+        timeout_leitura=LLM_TIMEOUT_LEITURA,
+        prazo=LLM_PRAZO,
+        tentativas=LLM_TENTATIVAS,
+        backoff=LLM_BACKOFF,
+    )
 
+# === PROMPT – HUMANIZADO ===
+def montar_prompt(pergunta: str) -> str:
     # Prompt humanizado, empático e direto
-    prompt = f"""
+    return f"""
 Você é o Dr. Legal, um advogado virtual empático e direto.
 Responda com no máximo 2 frases, em linguagem simples, como se estivesse falando com alguém em dificuldade.
 NUNCA diga "será analisado por um advogado".
@@ -77,105 +820,925 @@ Pergunta: {pergunta}
 Resposta:
     """.strip()
 
-    data = {
-        "model": "llama3-8b-8192",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.8,
-        "max_tokens": 200
-    }
+# === BACKENDS DO LLM ===
+# Cada backend tem seu próprio cliente (pool, fila e disjuntor) e mantém uma
+# média móvel da latência e da taxa de erro, usada pelo roteador para escolher
+# o backend mais rápido entre os saudáveis. Backend ainda sem medições parte
+# de `latencia_inicial`, e falhas contam como pelo menos essa latência.
+class BackendLLM(ABC):
+    nome = ""
+    PESO_EWMA = 0.2
+    MIN_MEDICOES = 5
+    TAXA_ERRO_MAX = 0.5
 
-    try:
-        resp = requests.post("https://api.groq.com/openai/v1/chat/completions", json=data, headers=headers, timeout=30)
+    def __init__(self, cliente: ClienteLLM, latencia_inicial: float, suspensao: float):
+        self.cliente = cliente
+        self.latencia_inicial = latencia_inicial
+        self.suspensao = suspensao
+        self.latencia = latencia_inicial  # segundos, média móvel de todas as chamadas
+        self.taxa_erro = 0.0
+        self.medicoes = 0
+        self.respostas = 0
+        self._suspenso_ate = 0.0
+        self._lock = threading.Lock()
+
+    def disponivel(self) -> bool:
+        return True
+
+    # O disjuntor só vê 5xx/429; erros como chave inválida ou modelo
+    # desconhecido (4xx) suspendem o backend pela taxa de erro
+    def saudavel(self) -> bool:
+        return (self.disponivel() and self.cliente.disjuntor.estado() != "aberto"
+                and time.monotonic() >= self._suspenso_ate)
+
+    # Menor é melhor
+    def pontuacao(self) -> float:
+        return self.latencia / max(0.05, 1.0 - self.taxa_erro)
+
+    def _medir(self, inicio: float, ok: bool):
+        decorrido = time.monotonic() - inicio
+        amostra = decorrido if ok else max(decorrido, self.latencia_inicial)
+        with self._lock:
+            self.taxa_erro += self.PESO_EWMA * ((0.0 if ok else 1.0) - self.taxa_erro)
+            self.latencia = amostra if not self.medicoes else self.latencia + self.PESO_EWMA * (amostra - self.latencia)
+            self.medicoes += 1
+            if ok:
+                self.respostas += 1
+                return
+            if self.medicoes < self.MIN_MEDICOES or self.taxa_erro < self.TAXA_ERRO_MAX:
+                return
+            self._suspenso_ate = time.monotonic() + self.suspensao
+        logger.warning(f"Backend {self.nome} suspenso por {self.suspensao:.0f}s: taxa de erro {self.taxa_erro:.0%}")
+
+    # Só o que veio do upstream (resposta, erro HTTP, timeout, conexão) entra
+    # na média: recusas locais da fila ou do disjuntor (LLMIndisponivel) não
+    # dizem nada sobre a saúde do backend
+    def completar(self, pergunta: str, prazo: float) -> str:
+        inicio = time.monotonic()
+        ok = False
+        try:
+            resposta = self._completar(pergunta, prazo)
+            ok = True
+            return resposta
+        except LLMIndisponivel:
+            ok = None
+            raise
+        finally:
+            if ok is not None:
+                self._medir(inicio, ok)
+
+    def stream(self, pergunta: str, prazo: float):
+        inicio = time.monotonic()
+        ok = False
+        try:
+            yield from self._stream(pergunta, prazo)
+            ok = True
+        except (LLMIndisponivel, GeneratorExit):
+            # Recusa local ou navegador desconectado
+            ok = None
+            raise
+        finally:
+            if ok is not None:
+                self._medir(inicio, ok)
+
+    def estatisticas(self) -> dict:
+        return {
+            "disponivel": self.disponivel(),
+            "latencia_media_ms": round(self.latencia * 1000, 1),
+            "taxa_erro": round(self.taxa_erro, 3),
+            "respostas": self.respostas,
+            "suspenso": time.monotonic() < self._suspenso_ate,
+            **self.cliente.estatisticas(),
+        }
+
+    @abstractmethod
+    def _completar(self, pergunta: str, prazo: float) -> str:
+        ...
+
+    @abstractmethod
+    def _stream(self, pergunta: str, prazo: float):
+        ...
+
+# API chat-completions da Groq (LLAMA 3), compatível com OpenAI
+class BackendGroq(BackendLLM):
+    nome = "groq"
+
+    def __init__(self, cliente: ClienteLLM, modelo: str, **kwargs):
+        super().__init__(cliente, **kwargs)
+        self.modelo = modelo
+
+    def disponivel(self) -> bool:
+        return bool(os.getenv("GROQ_API_KEY"))
+
+    def _requisicao(self, pergunta: str, stream: bool) -> dict:
+        headers = {
+            "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": self.modelo,
+            "messages": [{"role": "user", "content": montar_prompt(pergunta)}],
+            "temperature": 0.8,
+            "max_tokens": 200
+        }
+        if stream:
+            data["stream"] = True
+        return {"json": data, "headers": headers}
+
+    def _completar(self, pergunta: str, prazo: float) -> str:
+        resp = self.cliente.post("/chat/completions", prazo=prazo, **self._requisicao(pergunta, stream=False))
         resp.raise_for_status()
-        resposta = resp.json()["choices"][0]["message"]["content"].strip()
-        especialidade = detectar_area(pergunta)
-        return {"resposta": resposta, "especialidade": especialidade}
+        return resp.json()["choices"][0]["message"]["content"].strip()
+
+    # SSE no formato chat-completions: linhas "data: {...}" terminadas por "data: [DONE]"
+    def _stream(self, pergunta: str, prazo: float):
+        for linha in self.cliente.linhas("/chat/completions", prazo=prazo, **self._requisicao(pergunta, stream=True)):
+            if not linha.startswith("data:"):
+                continue
+            conteudo = linha[5:].strip()
+            if conteudo == "[DONE]":
+                break
+            delta = json.loads(conteudo)["choices"][0].get("delta", {})
+            if delta.get("content"):
+                yield delta["content"]
+
+# Ollama local (ou qualquer servidor compatível com /api/generate)
+class BackendOllama(BackendLLM):
+    nome = "ollama"
+
+    def __init__(self, cliente: ClienteLLM, modelo: str, **kwargs):
+        super().__init__(cliente, **kwargs)
+        self.modelo = modelo
+
+    def _requisicao(self, pergunta: str, stream: bool) -> dict:
+        return {"json": {
+            "model": self.modelo,
+            "prompt": montar_prompt(pergunta),
+            "stream": stream,
+            "options": {"temperature": 0.8, "num_predict": 200},
+        }}
+
+    def _completar(self, pergunta: str, prazo: float) -> str:
+        resp = self.cliente.post("/api/generate", prazo=prazo, **self._requisicao(pergunta, stream=False))
+        resp.raise_for_status()
+        return resp.json()["response"].strip()
+
+    # Streaming do Ollama: uma linha JSON por pedaço, {"response": "...", "done": false}
+    def _stream(self, pergunta: str, prazo: float):
+        for linha in self.cliente.linhas("/api/generate", prazo=prazo, **self._requisicao(pergunta, stream=True)):
+            pedaco = json.loads(linha)
+            if pedaco.get("response"):
+                yield pedaco["response"]
+            if pedaco.get("done"):
+                break
+
+# === ROTEADOR DO LLM (backend mais rápido + pedido de reserva) ===
+# Ordena os backends saudáveis pela pontuação e dispara o primeiro. Se ele não
+# responder em `hedge` segundos (ou falhar), dispara o próximo e fica com a
+# primeira resposta que chegar, sempre dentro do orçamento de latência.
+class RoteadorLLM:
+    def __init__(self, backends: list[BackendLLM], hedge: float, prazo: float):
+        self.backends = backends
+        self.hedge = hedge
+        self.prazo = prazo
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(backends) * (LLM_MAX_CONCORRENCIA + LLM_MAX_FILA)),
+            thread_name_prefix="llm",
+        )
+
+    def candidatos(self) -> list[BackendLLM]:
+        disponiveis = [b for b in self.backends if b.disponivel()]
+        saudaveis = [b for b in disponiveis if b.saudavel()]
+        # Sem nenhum saudável, tenta mesmo assim: os disjuntores recusam na hora
+        ordem = {b.nome: i for i, b in enumerate(self.backends)}
+        return sorted(saudaveis or disponiveis, key=lambda b: (b.pontuacao(), ordem[b.nome]))
+
+    def estatisticas(self) -> dict:
+        return {b.nome: b.estatisticas() for b in self.backends}
+
+    @staticmethod
+    def _executar(backend: BackendLLM, pergunta: str, prazo: float, perfil: Counter | None) -> str:
+        if perfil is None:
+            return backend.completar(pergunta, prazo)
+        with amostrador_perfil.vinculado(perfil):
+            return backend.completar(pergunta, prazo)
+
+    # Devolve (resposta, nome do backend que respondeu)
+    def completar(self, pergunta: str, orcamento: float | None = None) -> tuple[str, str]:
+        prazo = time.monotonic() + (orcamento or self.prazo)
+        proximos = self.candidatos()
+        if not proximos:
+            raise LLMIndisponivel("nenhum backend de LLM configurado")
+
+        # A thread da requisição só espera; o perfil amostra também o executor
+        perfil = amostrador_perfil.atual() if amostrador_perfil else None
+        futuros = {}
+        erro = None
+        while True:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            # Dispara o próximo: no início, quando o anterior falhou ou quando
+            # o tempo de reserva passou sem resposta
+            if proximos:
+                backend = proximos.pop(0)
+                futuros[self._executor.submit(self._executar, backend, pergunta, prazo, perfil)] = backend
+            if not futuros:
+                break
+            espera = min(restante, self.hedge) if proximos and self.hedge > 0 else restante
+            feitos, _ = wait(futuros, timeout=espera, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                backend = futuros.pop(futuro)
+                try:
+                    return futuro.result(), backend.nome
+                except Exception as e:
+                    logger.warning(f"Backend {backend.nome} falhou: {e}")
+                    erro = e
+        raise erro or LLMIndisponivel("orçamento de latência do LLM esgotado")
+
+    # Gera (nome do backend, pedaço de texto). Sem reserva: troca de backend
+    # apenas se o escolhido falhar antes do primeiro pedaço.
+    def stream(self, pergunta: str, orcamento: float | None = None):
+        prazo = time.monotonic() + (orcamento or self.prazo)
+        candidatos = self.candidatos()
+        if not candidatos:
+            raise LLMIndisponivel("nenhum backend de LLM configurado")
+        erro = None
+        for backend in candidatos:
+            enviou = False
+            try:
+                for texto in backend.stream(pergunta, prazo):
+                    enviou = True
+                    yield backend.nome, texto
+                return
+            except Exception as e:
+                if enviou:
+                    raise
+                logger.warning(f"Backend {backend.nome} falhou: {e}")
+                erro = e
+        raise erro
+
+def montar_backends() -> list[BackendLLM]:
+    # Sem medições, um backend vale o tempo de reserva: não passa na frente de
+    # um que já responde mais rápido que isso
+    medidas = {"latencia_inicial": LLM_HEDGE_MS / 1000 or 1.0, "suspensao": LLM_DISJUNTOR_RESFRIAMENTO}
+    backends = []
+    for nome in LLM_BACKENDS:
+        if nome == "groq":
+            backends.append(BackendGroq(novo_cliente_llm("groq", LLM_BASE_URL), LLM_MODELO, **medidas))
+        elif nome == "ollama" and OLLAMA_BASE_URL:
+            backends.append(BackendOllama(novo_cliente_llm("ollama", OLLAMA_BASE_URL), OLLAMA_MODELO, **medidas))
+        elif nome != "ollama":
+            logger.warning(f"Backend de LLM desconhecido em LLM_BACKENDS: {nome}")
+    return backends
+
+roteador_llm = RoteadorLLM(montar_backends(), hedge=LLM_HEDGE_MS / 1000, prazo=LLM_PRAZO)
+
+# === CHAMADA AO LLM ===
+def perguntar(pergunta: str, acertos: dict[str, set[str]] | None = None, orcamento: float | None = None) -> dict | None:
+    try:
+        resposta, backend = roteador_llm.completar(pergunta, orcamento)
+        especialidade = detectar_area(pergunta, acertos)
+        return {"resposta": resposta, "especialidade": especialidade, "backend": backend}
+    except LLMIndisponivel as e:
+        logger.warning(f"Pergunta desviada para o fallback: {e}")
+        return None
     except Exception as e:
-        logger.error(f"Erro na API Groq: {e}")
+        logger.error(f"Erro na API do LLM: {e}")
+        return None
+
+# Gera (backend, pedaço de texto) conforme o provedor envia.
+# Erros são propagados para o chamador decidir o fallback.
+def perguntar_stream(pergunta: str, orcamento: float | None = None):
+    yield from roteador_llm.stream(pergunta, orcamento)
+
+# === CACHE DE RESPOSTAS DA IA (LRU + TTL + chamada única por pergunta) ===
+# Chave: pergunta sem acentos, minúscula e sem pontuação/espaços repetidos,
+# então "Fui demitido!" e "fui  DEMITIDO" compartilham a mesma resposta
+def chave_cache(pergunta: str) -> str:
+    return " ".join(normalizar_tokens(pergunta))
+
+class _ChamadaEmVoo:
+    def __init__(self):
+        self.pronta = threading.Event()
+        self.resultado = None
+
+class CacheRespostas:
+    def __init__(self, max_itens: int, max_bytes: int, ttl: float,
+                 espera_max: float, redis_url: str = ""):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.espera_max = espera_max
+        self._itens: OrderedDict[str, tuple[float, dict, int]] = OrderedDict()
+        self._bytes = 0
+        self._em_voo: dict[str, _ChamadaEmVoo] = {}
+        self._lock = threading.Lock()
+        self.contadores = {"acertos": 0, "acertos_compartilhados": 0, "faltas": 0, "agrupadas": 0, "expulsas": 0}
+        # Backend compartilhado entre workers do gunicorn (opcional)
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                logger.warning("CACHE_REDIS_URL definido, mas o pacote redis não está instalado")
+            else:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {**self.contadores, "itens": len(self._itens), "bytes": self._bytes, "em_voo": len(self._em_voo)}
+
+    def _ler_local(self, chave: str) -> dict | None:
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        expira, valor, tamanho = item
+        if expira < time.monotonic():
+            del self._itens[chave]
+            self._bytes -= tamanho
+            return None
+        self._itens.move_to_end(chave)
+        return valor
+
+    def _gravar_local(self, chave: str, valor: dict, tamanho: int):
+        if tamanho > self.max_bytes:
+            return
+        antigo = self._itens.pop(chave, None)
+        if antigo:
+            self._bytes -= antigo[2]
+        self._itens[chave] = (time.monotonic() + self.ttl, valor, tamanho)
+        self._bytes += tamanho
+        while len(self._itens) > self.max_itens or self._bytes > self.max_bytes:
+            _, (_, _, removido) = self._itens.popitem(last=False)
+            self._bytes -= removido
+            self.contadores["expulsas"] += 1
+
+    def _ler_compartilhado(self, chave: str) -> dict | None:
+        if self._redis is None:
+            return None
+        try:
+            bruto = self._redis.get(f"drlegal:resposta:{chave}")
+            return json.loads(bruto) if bruto else None
+        except Exception as e:
+            logger.warning(f"Cache compartilhado indisponível: {e}")
+            return None
+
+    def _gravar_compartilhado(self, chave: str, serializado: bytes):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(f"drlegal:resposta:{chave}", serializado, ex=max(1, int(self.ttl)))
+        except Exception as e:
+            logger.warning(f"Cache compartilhado indisponível: {e}")
+
+    # Consulta sem calcular (usado pelo /chat/stream, que não agrupa chamadas)
+    def obter(self, chave: str) -> dict | None:
+        with self._lock:
+            valor = self._ler_local(chave)
+            if valor is not None:
+                self.contadores["acertos"] += 1
+                return valor
+        valor = self._ler_compartilhado(chave)
+        with self._lock:
+            if valor is None:
+                self.contadores["faltas"] += 1
+            else:
+                self.contadores["acertos_compartilhados"] += 1
+                self._gravar_local(chave, valor, len(json.dumps(valor, ensure_ascii=False).encode("utf-8")) + len(chave))
+        return valor
+
+    def gravar(self, chave: str, valor: dict, compartilhar: bool = True):
+        serializado = json.dumps(valor, ensure_ascii=False).encode("utf-8")
+        if compartilhar:
+            self._gravar_compartilhado(chave, serializado)
+        with self._lock:
+            self._gravar_local(chave, valor, len(serializado) + len(chave))
+
+    # Devolve (resposta, veio do cache) ou chama `calcular` uma única vez por
+    # chave: perguntas idênticas que chegam durante a chamada esperam por ela
+    # (e não contam como vindas do cache). Resultados None (falha da IA) não
+    # são guardados.
+    def obter_ou_calcular(self, chave: str, calcular) -> tuple[dict | None, bool]:
+        with self._lock:
+            valor = self._ler_local(chave)
+            if valor is not None:
+                self.contadores["acertos"] += 1
+                return valor, True
+            voo = self._em_voo.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._em_voo[chave] = _ChamadaEmVoo()
+            else:
+                self.contadores["agrupadas"] += 1
+        if not lider:
+            voo.pronta.wait(self.espera_max)
+            return voo.resultado, False
+
+        try:
+            valor = self._ler_compartilhado(chave)
+            compartilhado = valor is not None
+            if not compartilhado:
+                valor = calcular()
+            if valor is not None:
+                self.gravar(chave, valor, compartilhar=not compartilhado)
+            with self._lock:
+                self.contadores["acertos_compartilhados" if compartilhado else "faltas"] += 1
+            voo.resultado = valor
+            return valor, compartilhado
+        finally:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+            voo.pronta.set()
+
+cache_respostas = CacheRespostas(
+    max_itens=CACHE_MAX_ITENS,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl=CACHE_TTL,
+    espera_max=LLM_PRAZO,
+    redis_url=CACHE_REDIS_URL,
+)
+
+def perguntar_com_cache(pergunta: str, acertos: dict[str, set[str]] | None = None) -> tuple[dict | None, bool]:
+    return cache_respostas.obter_ou_calcular(chave_cache(pergunta), lambda: perguntar(pergunta, acertos))
+
+# === ÍNDICE DO FAQ (TF-IDF de n-gramas de caracteres + cosseno) ===
+# Cada pergunta do FAQ vira um vetor TF-IDF de n-gramas de 3 a 5 caracteres do
+# texto normalizado, com as colunas definidas por hash (sem vocabulário para
+# guardar). O índice é invertido (coluna -> perguntas e pesos), então a busca
+# só toca as colunas presentes na pergunta do usuário.
+# Fica salvo em arquivos .npy abertos com mmap: os workers sobem rápido e
+# compartilham as mesmas páginas de memória.
+class IndiceFAQ:
+    NGRAMAS = (3, 4, 5)
+    COLUNAS = 1 << 18
+    ARQUIVOS = ("indptr", "docs", "pesos", "idf")
+
+    def __init__(self, entradas: list[dict], indptr, docs, pesos, idf):
+        self.entradas = entradas
+        self.indptr = indptr
+        self.docs = docs
+        self.pesos = pesos
+        self.idf = idf
+
+    @classmethod
+    def colunas(cls, texto: str) -> tuple[np.ndarray, np.ndarray]:
+        norm = f" {' '.join(normalizar_tokens(texto))} ".encode("utf-8")
+        hashes = [zlib.crc32(norm[i:i + n]) for n in cls.NGRAMAS for i in range(len(norm) - n + 1)]
+        cols = np.asarray(hashes, dtype=np.int64) & (cls.COLUNAS - 1)
+        return np.unique(cols, return_counts=True)
+
+    @classmethod
+    def construir(cls, entradas: list[dict]) -> "IndiceFAQ":
+        total = len(entradas)
+        por_doc = [cls.colunas(e["pergunta"]) for e in entradas]
+        todas_cols = np.concatenate([cols for cols, _ in por_doc]) if por_doc else np.zeros(0, np.int64)
+        df = np.bincount(todas_cols, minlength=cls.COLUNAS)
+        idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+
+        cols_l, docs_l, pesos_l = [], [], []
+        for doc, (cols, contagens) in enumerate(por_doc):
+            peso = (1 + np.log(contagens)) * idf[cols]
+            cols_l.append(cols)
+            docs_l.append(np.full(len(cols), doc, dtype=np.int32))
+            pesos_l.append(peso / np.linalg.norm(peso))
+        cols = np.concatenate(cols_l) if cols_l else np.zeros(0, np.int64)
+        ordem = np.argsort(cols, kind="stable")
+        indptr = np.zeros(cls.COLUNAS + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=cls.COLUNAS), out=indptr[1:])
+        docs = (np.concatenate(docs_l) if docs_l else np.zeros(0, np.int32))[ordem]
+        pesos = (np.concatenate(pesos_l) if pesos_l else np.zeros(0, np.float32))[ordem].astype(np.float32)
+        return cls(entradas, indptr, docs, pesos, idf)
+
+    def salvar(self, diretorio: str):
+        os.makedirs(diretorio, exist_ok=True)
+        for nome in self.ARQUIVOS:
+            np.save(os.path.join(diretorio, f"{nome}.npy"), getattr(self, nome))
+        with open(os.path.join(diretorio, "entradas.json"), "w", encoding="utf-8") as f:
+            json.dump(self.entradas, f, ensure_ascii=False)
+
+    @classmethod
+    def carregar(cls, diretorio: str) -> "IndiceFAQ":
+        arrays = {nome: np.load(os.path.join(diretorio, f"{nome}.npy"), mmap_mode="r") for nome in cls.ARQUIVOS}
+        with open(os.path.join(diretorio, "entradas.json"), encoding="utf-8") as f:
+            entradas = json.load(f)
+        return cls(entradas, **arrays)
+
+    # Devolve (entrada mais parecida, similaridade de cosseno) ou None
+    def buscar(self, pergunta: str) -> tuple[dict, float] | None:
+        if not self.entradas:
+            return None
+        cols, contagens = self.colunas(pergunta)
+        if not len(cols):
+            return None
+        consulta = (1 + np.log(contagens)) * self.idf[cols]
+        consulta /= np.linalg.norm(consulta)
+
+        inicios = self.indptr[cols]
+        tamanhos = self.indptr[cols + 1] - inicios
+        total = int(tamanhos.sum())
+        if not total:
+            return None
+        # Posições de todas as listas invertidas envolvidas, de uma vez
+        deslocamentos = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos)
+        posicoes = deslocamentos + np.arange(total)
+        pontuacoes = np.bincount(self.docs[posicoes], weights=self.pesos[posicoes] * np.repeat(consulta, tamanhos),
+                                 minlength=len(self.entradas))
+        melhor = int(pontuacoes.argmax())
+        return self.entradas[melhor], float(pontuacoes[melhor])
+
+# Apaga os índices de versões anteriores do FAQ (diretórios com outro hash).
+# Erros são ignorados: um worker antigo pode ainda estar com um deles aberto.
+def remover_indices_antigos(diretorio: str, atual: str):
+    for nome in os.listdir(diretorio):
+        if nome != atual and len(nome) == 16 and all(c in "0123456789abcdef" for c in nome):
+            shutil.rmtree(os.path.join(diretorio, nome), ignore_errors=True)
+
+# Lê o FAQ ({"Área": [{"pergunta", "resposta"}, ...]}) e usa o índice já salvo
+# para esse conteúdo; se ainda não existir, monta e salva. O diretório leva o
+# hash do arquivo, então editar o FAQ gera um índice novo sem apagar o antigo
+# em uso, e workers subindo juntos não sobrescrevem o trabalho um do outro.
+def carregar_indice_faq(arquivo: str, diretorio: str) -> IndiceFAQ | None:
+    if not os.path.exists(arquivo):
+        logger.warning(f"FAQ não encontrado em {arquivo}; seguindo sem respostas prontas")
+        return None
+    with open(arquivo, "rb") as f:
+        bruto = f.read()
+    destino = os.path.join(diretorio, hashlib.sha256(bruto).hexdigest()[:16])
+    if not os.path.exists(os.path.join(destino, "entradas.json")):
+        faq = json.loads(bruto)
+        entradas = [{"pergunta": e["pergunta"], "resposta": e["resposta"], "area": area}
+                    for area, itens in faq.items() for e in itens]
+        temporario = f"{destino}.tmp{os.getpid()}"
+        IndiceFAQ.construir(entradas).salvar(temporario)
+        try:
+            os.rename(temporario, destino)
+        except OSError:
+            shutil.rmtree(temporario, ignore_errors=True)
+            # Só segue se foi outro worker que terminou primeiro; usa o dele
+            if not os.path.exists(os.path.join(destino, "entradas.json")):
+                raise
+        else:
+            remover_indices_antigos(diretorio, os.path.basename(destino))
+        logger.info(f"Índice do FAQ montado com {len(entradas)} perguntas em {destino}")
+    return IndiceFAQ.carregar(destino)
+
+try:
+    indice_faq = carregar_indice_faq(FAQ_ARQUIVO, FAQ_INDICE_DIR)
+except Exception as e:
+    logger.error(f"Erro ao montar o índice do FAQ: {e}")
+    indice_faq = None
+
+def buscar_faq(pergunta: str) -> dict | None:
+    if indice_faq is None:
+        return None
+    achado = indice_faq.buscar(pergunta)
+    if achado is None or achado[1] < FAQ_LIMIAR:
         return None
+    return achado[0]
+
+# === COMPRESSÃO E CORPOS PRÉ-COMPILADOS ===
+# Corpos que nunca mudam (a página inicial e as respostas prontas) são
+# serializados e comprimidos uma única vez, no nível máximo, na subida do app.
+# Os demais são comprimidos na hora, num nível mais leve, quando o navegador
+# aceita e o corpo passa de COMPRESSAO_MIN_BYTES.
+def comprimir(corpo: bytes, codificacao: str, nivel_maximo: bool = False) -> bytes:
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=11 if nivel_maximo else 4)
+    return gzip.compress(corpo, compresslevel=9 if nivel_maximo else 5, mtime=0)
+
+# Codificações aceitas pelo navegador, na ordem de preferência do servidor
+def codificacoes_aceitas() -> list[str]:
+    aceitas = request.accept_encodings
+    return [c for c in ("br", "gzip") if aceitas[c] and (c != "br" or brotli)]
+
+def montar_resposta(corpo: bytes, mimetype: str, codificacao: str | None, cabecalhos: dict | None = None) -> Response:
+    resp = Response(corpo, mimetype=mimetype, headers=cabecalhos)
+    if codificacao:
+        resp.headers["Content-Encoding"] = codificacao
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+def responder_json(dados: dict) -> Response:
+    corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+    codificacao = None
+    if len(corpo) >= COMPRESSAO_MIN_BYTES:
+        codificacao = next(iter(codificacoes_aceitas()), None)
+        if codificacao:
+            corpo = comprimir(corpo, codificacao)
+    return montar_resposta(corpo, "application/json", codificacao)
+
+class CorpoPronto:
+    def __init__(self, corpo: bytes, mimetype: str):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(corpo).hexdigest()[:32]
+        self.variantes: dict[str | None, bytes] = {None: corpo}
+        if len(corpo) >= COMPRESSAO_MIN_BYTES:
+            for codificacao in ("br", "gzip") if brotli else ("gzip",):
+                comprimido = comprimir(corpo, codificacao, nivel_maximo=True)
+                if len(comprimido) < len(corpo):
+                    self.variantes[codificacao] = comprimido
+
+    @classmethod
+    def de_json(cls, dados: dict) -> "CorpoPronto":
+        return cls(json.dumps(dados, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    # Com cache_control, envia um ETag forte por variante e responde 304 se o
+    # navegador já tem exatamente aquela variante
+    def responder(self, cache_control: str | None = None) -> Response:
+        codificacao = next((c for c in codificacoes_aceitas() if c in self.variantes), None)
+        if cache_control is None:
+            return montar_resposta(self.variantes[codificacao], self.mimetype, codificacao)
+        etag = f"{self.etag}-{codificacao}" if codificacao else self.etag
+        cabecalhos = {"ETag": f'"{etag}"', "Cache-Control": cache_control}
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304, headers=cabecalhos)
+            resp.vary.add("Accept-Encoding")
+            return resp
+        return montar_resposta(self.variantes[codificacao], self.mimetype, codificacao, cabecalhos)
 
 # === ROTAS ===
+# O template não tem partes dinâmicas: renderiza e comprime uma vez só
+with app.app_context():
+    PAGINA_INICIAL = CorpoPronto(render_template("index.html").encode("utf-8"), "text/html")
+
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return PAGINA_INICIAL.responder(PAGINA_CACHE_CONTROL)
 
-@app.route("/chat", methods=["POST"])
-def chat():
-    data = request.json or {}
-    pergunta = data.get("pergunta", "").strip()
+# === RESPOSTAS PRONTAS ===
+# Tudo o que não depende do texto da pergunta é montado uma vez na subida:
+# as mensagens fixas, o rodapé de cada área e cada combinação tema × área
+AREAS = [*PALAVRAS_JURIDICAS, "Jurídico Geral"]
 
-    if not pergunta:
-        return jsonify({
-            "resposta": (
-                "Olá! Aqui é o <b>Dr. Legal</b> 🌟<br><br>"
-                "Seu direito é importante — e eu estou aqui para te ajudar.<br><br>"
-                "Posso te orientar sobre:<br>⚖️ Família | 💼 Trabalho | 🛡️ Consumidor | 🏥 Previdência | ⚖️ Penal | 🏠 Imobiliário<br><br>"
-                f"{botao_whatsapp('💬 Falar com um advogado agora', 'Tenho uma dúvida jurídica urgente.')}"
-            )
-        })
+def montar_rodape(esp: str) -> str:
+    return f"<br><br>📌 <b>{esp}</b><br>{botao_whatsapp(f'📩 Falar com especialista em {esp}', f'Preciso de ajuda com um caso de {esp}.')}"
 
-    p = pergunta.lower()
+RODAPES = {esp: montar_rodape(esp) for esp in AREAS}
+
+def rodape_especialista(esp: str) -> str:
+    return RODAPES.get(esp) or montar_rodape(esp)
+
+def resposta_fallback(pergunta: str, esp: str) -> str:
+    return f"Isso é sério, e você não precisa enfrentar sozinho.<br><br>Vamos te encaminhar para um <b>especialista em {esp}</b>.<br><br>{botao_whatsapp('📩 Falar com um advogado agora', f'Preciso de ajuda com: {pergunta[:100]}...')}"
+
+HTML_VAZIA = (
+    "Olá! Aqui é o <b>Dr. Legal</b> 🌟<br><br>"
+    "Seu direito é importante — e eu estou aqui para te ajudar.<br><br>"
+    "Posso te orientar sobre:<br>⚖️ Família | 💼 Trabalho | 🛡️ Consumidor | 🏥 Previdência | ⚖️ Penal | 🏠 Imobiliário<br><br>"
+    f"{botao_whatsapp('💬 Falar com um advogado agora', 'Tenho uma dúvida jurídica urgente.')}"
+)
+
+HTML_SAUDACAO = (
+    "Olá! Aqui é o <b>Dr. Legal</b>, seu assistente jurídico. 😊<br><br>"
+    "Estou aqui para te ajudar com:<br>"
+    "🔹 Divórcio, guarda, pensão<br>"
+    "🔹 Demissão, FGTS, horas extras<br>"
+    "🔹 Golpes no PIX, cobranças indevidas<br>"
+    "🔹 Aposentadoria, auxílio-doença, BPC<br>"
+    "🔹 Acidentes, erros médicos, indenizações<br><br>"
+    "Me conta o que você precisa?<br><br>"
+    f"{botao_whatsapp('📞 Falar com especialista agora', 'Quero falar com um advogado agora.')}"
+)
+
+HTML_DESPEDIDA = "Fico feliz em ter ajudado! Conte com o Dr. Legal sempre que precisar. Até breve! 👋"
+
+HTML_NAO_JURIDICO = (
+    "Isso é importante para a vida, mas meu foco é te ajudar com direitos.<br><br>"
+    "Como:<br>⚖️ Família | 💼 Trabalho | 🛡️ Consumidor | 🏥 Previdência | ⚖️ Penal | 🏠 Imobiliário<br><br>"
+    f"{botao_whatsapp('✅ Falar sobre meu caso', 'Quero falar sobre um problema jurídico.')}"
+)
+
+HTML_TEMAS = {
+    (tema, esp): f"{texto}<br><br>📌 <b>{esp}</b><br>{botao_whatsapp(f'📞 Falar com {esp}', f'Quero falar sobre {tema}.')}"
+    for tema, texto in TEMAS.items() for esp in AREAS
+}
+
+# Corpo JSON do /chat de cada resposta fixa, já comprimido
+JSON_PRONTOS = {
+    html: CorpoPronto.de_json({"resposta": html})
+    for html in (HTML_VAZIA, HTML_SAUDACAO, HTML_DESPEDIDA, HTML_NAO_JURIDICO, *HTML_TEMAS.values())
+}
+
+# Todos os ramos que não dependem da IA, como (ramo, html); None quando a
+# pergunta deve ir ao LLM
+def resposta_rapida(pergunta: str, acertos: dict[str, set[str]]) -> tuple[str, str] | None:
+    if not pergunta:
+        return "vazia", HTML_VAZIA
 
     # Saudações
-    if any(w in p for w in ["oi", "olá", "bom dia", "boa tarde"]):
-        return jsonify({
-            "resposta": (
-                "Olá! Aqui é o <b>Dr. Legal</b>, seu assistente jurídico. 😊<br><br>"
-                "Estou aqui para te ajudar com:<br>"
-                "🔹 Divórcio, guarda, pensão<br>"
-                "🔹 Demissão, FGTS, horas extras<br>"
-                "🔹 Golpes no PIX, cobranças indevidas<br>"
-                "🔹 Aposentadoria, auxílio-doença, BPC<br>"
-                "🔹 Acidentes, erros médicos, indenizações<br><br>"
-                "Me conta o que você precisa?<br><br>"
-                f"{botao_whatsapp('📞 Falar com especialista agora', 'Quero falar com um advogado agora.')}"
-            )
-        })
+    if GRUPO_SAUDACAO in acertos:
+        return "saudacao", HTML_SAUDACAO
 
     # Despedidas
-    if any(w in p for w in ["tchau", "obrigado", "valeu"]):
-        return jsonify({"resposta": "Fico feliz em ter ajudado! Conte com o Dr. Legal sempre que precisar. Até breve! 👋"})
+    if GRUPO_DESPEDIDA in acertos:
+        return "despedida", HTML_DESPEDIDA
 
     # Temas comuns (respostas rápidas)
-    temas = {
-        "divórcio": "Temos especialistas em divórcio rápido, consensual ou litigioso.",
-        "trabalho": "Podemos te ajudar com direitos trabalhistas e verbas rescisórias.",
-        "pix": "Errou no PIX? Temos ações para tentar recuperar seu dinheiro.",
-        "acidente": "Se foi vítima de acidente, você pode ter direito a indenização.",
-        "inss": "Problema com aposentadoria ou auxílio? Podemos revisar seu caso."
-    }
-    for tema, desc in temas.items():
-        if tema in p:
-            esp = detectar_area(pergunta)
-            return jsonify({
-                "resposta": f"{desc}<br><br>📌 <b>{esp}</b><br>{botao_whatsapp(f'📞 Falar com {esp}', f'Quero falar sobre {tema}.')}"
-            })
+    tema = tema_comum(acertos)
+    if tema:
+        return "tema", HTML_TEMAS[(tema, detectar_area(pergunta, acertos))]
 
-    # Usar IA se for tema jurídico
-    if eh_tema_juridico(pergunta):
-        logger.info(f"Processando pergunta jurídica com IA: {pergunta}")
-        resultado = perguntar(pergunta)
-        if resultado:
-            esp = resultado["especialidade"]
-            return jsonify({
-                "resposta": f"{resultado['resposta']}<br><br>📌 <b>{esp}</b><br>{botao_whatsapp(f'📩 Falar com especialista em {esp}', f'Preciso de ajuda com um caso de {esp}.')}"
-            })
-        else:
-            logger.warning("IA falhou. Usando fallback.")
-            esp = detectar_area(pergunta)
-            return jsonify({
-                "resposta": f"Isso é sério, e você não precisa enfrentar sozinho.<br><br>Vamos te encaminhar para um <b>especialista em {esp}</b>.<br><br>{botao_whatsapp('📩 Falar com um advogado agora', f'Preciso de ajuda com: {pergunta[:100]}...')}"
-            })
+    # Resposta pronta do FAQ se a pergunta for parecida o bastante com uma
+    # conhecida. Vem antes do filtro por palavras-chave: uma correspondência
+    # forte no FAQ já mostra que o tema é jurídico.
+    faq = buscar_faq(pergunta)
+    if faq:
+        return "faq", f"{faq['resposta']}{rodape_especialista(faq['area'])}"
+
+    # Tema jurídico: segue para a IA
+    if eh_tema_juridico(pergunta, acertos):
+        return None
 
     # Não jurídico
-    return jsonify({
-        "resposta": (
-            "Isso é importante para a vida, mas meu foco é te ajudar com direitos.<br><br>"
-            "Como:<br>⚖️ Família | 💼 Trabalho | 🛡️ Consumidor | 🏥 Previdência | ⚖️ Penal | 🏠 Imobiliário<br><br>"
-            f"{botao_whatsapp('✅ Falar sobre meu caso', 'Quero falar sobre um problema jurídico.')}"
-        )
+    return "nao_juridico", HTML_NAO_JURIDICO
+
+# === INSTRUMENTAÇÃO DAS ROTAS DO CHAT ===
+def registrar_ramo(rota: str, ramo: str, duracao: float):
+    metricas.incrementar("drlegal_chat_respostas_total", rota=rota, ramo=ramo)
+    metricas.observar("drlegal_chat_duracao_segundos", duracao, rota=rota, ramo=ramo)
+
+# Mede a rota inteira e registra o ramo que a view gravou em g.ramo. Uma view
+# que responde em streaming assume g.encerrar (e o deixa None): chama-o com o
+# ramo quando o stream termina, e o fechamento da resposta o chama como
+# "desconectado" se o stream nem chegou a começar.
+def instrumentar(rota: str):
+    def decorador(view):
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            metricas.garantir_gravador()
+            inicio = time.perf_counter()
+            caminho = request.path
+            contagem = amostrador_perfil.iniciar() if amostrador_perfil else None
+            metricas.incrementar("drlegal_chat_em_andamento", rota=rota)
+            encerrada = threading.Event()
+
+            def encerrar(ramo: str | None):
+                if encerrada.is_set():
+                    return
+                encerrada.set()
+                duracao = time.perf_counter() - inicio
+                metricas.incrementar("drlegal_chat_em_andamento", -1, rota=rota)
+                if contagem is not None:
+                    amostrador_perfil.finalizar(contagem, duracao, f"{caminho} ramo={ramo}")
+                if ramo:
+                    registrar_ramo(rota, ramo, duracao)
+
+            g.ramo = None
+            g.encerrar = encerrar
+            try:
+                resp = view(*args, **kwargs)
+            except BaseException:
+                encerrar(g.ramo)
+                raise
+            if g.encerrar is None:
+                resp.call_on_close(lambda: encerrar("desconectado"))
+            else:
+                encerrar(g.ramo)
+            return resp
+        return envolvida
+    return decorador
+
+@app.route("/chat", methods=["POST"])
+@instrumentar("chat")
+def chat():
+    data = request.json or {}
+    pergunta = data.get("pergunta", "").strip()
+
+    # Uma única passada de detecção, reaproveitada por todos os ramos
+    acertos = detectar_termos(pergunta) if pergunta else {}
+
+    rapida = resposta_rapida(pergunta, acertos)
+    if rapida is not None:
+        g.ramo, html = rapida
+        pronto = JSON_PRONTOS.get(html)
+        return pronto.responder() if pronto else responder_json({"resposta": html})
+
+    # Usar IA se for tema jurídico
+    logger.info(f"Processando pergunta jurídica com IA: {pergunta}")
+    resultado, em_cache = perguntar_com_cache(pergunta, acertos)
+    if resultado:
+        g.ramo = "cache" if em_cache else "ia"
+        esp = resultado["especialidade"]
+        return responder_json({"resposta": f"{resultado['resposta']}{rodape_especialista(esp)}", "backend": resultado.get("backend")})
+
+    logger.warning("IA falhou. Usando fallback.")
+    g.ramo = "fallback"
+    esp = detectar_area(pergunta, acertos)
+    return responder_json({"resposta": resposta_fallback(pergunta, esp), "fallback": True})
+
+# === STREAMING (Server-Sent Events) ===
+def evento_sse(nome: str, dados: dict) -> str:
+    return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def resposta_sse(eventos) -> Response:
+    return Response(eventos, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # evita buffer em proxies (nginx/Render)
     })
 
+# Evento "fim" de cada resposta fixa, já serializado
+EVENTOS_PRONTOS = {html: evento_sse("fim", {"resposta": html}) for html in JSON_PRONTOS}
+
+# Eventos enviados:
+#   token -> {"texto": "..."}           pedaço da resposta da IA, na ordem
+#   fim   -> {"especialidade", "rodape", "backend"} rodapé com a área e o botão do WhatsApp
+#   fim   -> {"resposta": "<html>"}      resposta completa (ramos sem IA)
+#   fim   -> {"resposta": "<html>", "fallback": true} a IA falhou; encaminha ao WhatsApp
+@app.route("/chat/stream", methods=["POST"])
+@instrumentar("stream")
+def chat_stream():
+    data = request.json or {}
+    pergunta = data.get("pergunta", "").strip()
+
+    acertos = detectar_termos(pergunta) if pergunta else {}
+
+    rapida = resposta_rapida(pergunta, acertos)
+    if rapida is not None:
+        g.ramo, html = rapida
+        return resposta_sse([EVENTOS_PRONTOS.get(html) or evento_sse("fim", {"resposta": html})])
+
+    esp = detectar_area(pergunta, acertos)
+    chave = chave_cache(pergunta)
+    encerrar, g.encerrar = g.encerrar, None
+
+    # O ramo só é definido quando o stream chega ao fim; se o navegador
+    # desconectar antes, fica registrado como "desconectado"
+    def gerar():
+        ramo = "desconectado"
+        try:
+            em_cache = cache_respostas.obter(chave)
+            if em_cache:
+                yield evento_sse("token", {"texto": em_cache["resposta"]})
+                yield evento_sse("fim", {"especialidade": em_cache["especialidade"], "rodape": rodape_especialista(em_cache["especialidade"]), "backend": em_cache.get("backend")})
+                ramo = "cache"
+                return
+
+            logger.info(f"Processando pergunta jurídica com IA (stream): {pergunta}")
+            partes = []
+            completa = False
+            backend = None
+            try:
+                for backend, texto in perguntar_stream(pergunta):
+                    partes.append(texto)
+                    yield evento_sse("token", {"texto": texto})
+                completa = True
+            except Exception as e:
+                logger.error(f"Erro na API do LLM (stream): {e}")
+                if not partes:
+                    logger.warning("IA falhou. Usando fallback.")
+                    yield evento_sse("fim", {"resposta": resposta_fallback(pergunta, esp), "fallback": True})
+                    ramo = "fallback"
+                    return
+
+            # Resposta interrompida no meio não vai para o cache
+            resposta = "".join(partes).strip()
+            if completa and resposta:
+                cache_respostas.gravar(chave, {"resposta": resposta, "especialidade": esp, "backend": backend})
+            yield evento_sse("fim", {"especialidade": esp, "rodape": rodape_especialista(esp), "backend": backend})
+            ramo = "ia" if completa else "ia_interrompida"
+        finally:
+            encerrar(ramo)
+
+    return resposta_sse(gerar())
+
+# Estatísticas que já existem no cache e nos backends, lidas na exportação
+metricas.contador("drlegal_cache_eventos_total", "Eventos do cache de respostas da IA")
+metricas.medidor("drlegal_cache_itens", "Respostas guardadas no cache local")
+metricas.medidor("drlegal_cache_bytes", "Tamanho estimado do cache local")
+metricas.contador("drlegal_llm_admissao_total", "Resultado da admissão de chamadas ao LLM")
+metricas.medidor("drlegal_llm_fila", "Chamadas ao LLM esperando vaga")
+metricas.medidor("drlegal_llm_disjuntor_aberto", "1 quando o disjuntor do backend está aberto")
+metricas.medidor("drlegal_llm_latencia_media_segundos", "Média móvel da latência usada no roteamento")
+
+def coletar_estatisticas():
+    cache = cache_respostas.estatisticas()
+    for evento in ("acertos", "acertos_compartilhados", "faltas", "agrupadas", "expulsas"):
+        yield "drlegal_cache_eventos_total", {"evento": evento}, cache[evento]
+    yield "drlegal_cache_itens", {}, cache["itens"]
+    yield "drlegal_cache_bytes", {}, cache["bytes"]
+    for backend in roteador_llm.backends:
+        nome = {"backend": backend.nome}
+        admissao = backend.cliente.admissao.estatisticas()
+        for resultado in ("admitidas", "recusadas_fila_cheia", "recusadas_espera"):
+            yield "drlegal_llm_admissao_total", {**nome, "resultado": resultado}, admissao[resultado]
+        yield "drlegal_llm_admissao_total", {**nome, "resultado": "recusadas_disjuntor"}, backend.cliente.disjuntor.contadores["recusadas"]
+        yield "drlegal_llm_fila", nome, admissao["na_fila"]
+        yield "drlegal_llm_disjuntor_aberto", nome, int(backend.cliente.disjuntor.estado() == "aberto")
+        yield "drlegal_llm_latencia_media_segundos", nome, backend.latencia
+
+metricas.registrar_coletor(coletar_estatisticas)
+
+@app.route("/metrics")
+def exportar_metricas():
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/llm/estatisticas")
+def estatisticas_llm():
+    return jsonify(roteador_llm.estatisticas())
+
+@app.route("/cache/estatisticas")
+def estatisticas_cache():
+    return jsonify(cache_respostas.estatisticas())
+
 # === INICIAR ===
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,111 @@
+# Avaliação em lote do índice do FAQ.
+#
+# Lê um arquivo JSON Lines com {"pergunta": "...", "area": "..."} (area é
+# opcional: sem ela a pergunta conta só para a taxa de acerto do índice) e
+# informa a taxa de respostas acima do limiar, a precisão da área nas
+# respostas dadas e a latência da busca. Também passa cada pergunta pelo mesmo
+# roteamento do /chat (detectar_termos + resposta_rapida) e mostra quantas
+# recebem de fato a resposta do FAQ e para onde vão as demais.
+#
+# Uso (a partir de web-container/):
+#   python bench/avaliar_faq.py
+#   python bench/avaliar_faq.py bench/perguntas_faq.jsonl --limiar 0.4 --detalhes
+import argparse
+import json
+import os
+from collections import Counter
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from app import FAQ_ARQUIVO, FAQ_INDICE_DIR, FAQ_LIMIAR, carregar_indice_faq, detectar_termos, resposta_rapida  # noqa: E402
+
+AMOSTRA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perguntas_faq.jsonl")
+
+def percentil(valores: list[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Avaliação em lote do índice do FAQ")
+    parser.add_argument("amostra", nargs="?", default=AMOSTRA)
+    parser.add_argument("--faq", default=FAQ_ARQUIVO)
+    parser.add_argument("--indice", default=FAQ_INDICE_DIR)
+    parser.add_argument("--limiar", type=float, default=FAQ_LIMIAR)
+    parser.add_argument("--detalhes", action="store_true", help="mostra cada pergunta e o que foi encontrado")
+    parser.add_argument("--json", action="store_true", help="imprime o resumo em JSON")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    indice = carregar_indice_faq(args.faq, args.indice)
+    carga_ms = (time.perf_counter() - inicio) * 1000
+    if indice is None:
+        sys.exit(f"FAQ não encontrado: {args.faq}")
+
+    with open(args.amostra, encoding="utf-8") as f:
+        amostra = [json.loads(linha) for linha in f if linha.strip()]
+
+    # O roteamento consulta o índice e o limiar globais do app
+    app.indice_faq = indice
+    app.FAQ_LIMIAR = args.limiar
+
+    latencias, respondidas, com_area, area_certa = [], 0, 0, 0
+    ramos, perdidas = Counter(), Counter()
+    for item in amostra:
+        t = time.perf_counter()
+        achado = indice.buscar(item["pergunta"])
+        latencias.append((time.perf_counter() - t) * 1000)
+        entrada, score = achado if achado else (None, 0.0)
+        respondeu = entrada is not None and score >= args.limiar
+        respondidas += respondeu
+        if respondeu and item.get("area"):
+            com_area += 1
+            area_certa += entrada["area"] == item["area"]
+        rapida = resposta_rapida(item["pergunta"], detectar_termos(item["pergunta"]))
+        ramo = rapida[0] if rapida else "ia"
+        ramos[ramo] += 1
+        if respondeu and ramo != "faq":
+            perdidas[ramo] += 1
+        if args.detalhes:
+            marca = "✔" if respondeu else "·"
+            print(f"{marca} {score:.2f} [{ramo}] {item['pergunta']!r} -> {entrada['pergunta'] if entrada else None!r}")
+
+    resumo = {
+        "perguntas": len(amostra),
+        "entradas_faq": len(indice.entradas),
+        "limiar": args.limiar,
+        "taxa_resposta": round(respondidas / len(amostra), 3) if amostra else 0.0,
+        "precisao_area": round(area_certa / com_area, 3) if com_area else None,
+        "roteamento": {
+            "taxa_resposta_faq": round(ramos["faq"] / len(amostra), 3) if amostra else 0.0,
+            "ramos": dict(ramos),
+            "faq_desviadas": dict(perdidas),
+        },
+        "carga_indice_ms": round(carga_ms, 2),
+        "latencia_ms": {
+            "p50": round(percentil(latencias, 50), 3),
+            "p95": round(percentil(latencias, 95), 3),
+            "p99": round(percentil(latencias, 99), 3),
+        } if latencias else {},
+    }
+    if args.json:
+        print(json.dumps(resumo, ensure_ascii=False, indent=2))
+        return
+    print(f"perguntas: {resumo['perguntas']} | entradas no FAQ: {resumo['entradas_faq']} | limiar: {args.limiar}")
+    print(f"respondidas pelo FAQ: {respondidas} ({resumo['taxa_resposta']:.1%})")
+    if com_area:
+        print(f"área correta nas respondidas: {area_certa}/{com_area} ({resumo['precisao_area']:.1%})")
+    rota = resumo["roteamento"]
+    print(f"respondidas pelo FAQ no /chat: {ramos['faq']} ({rota['taxa_resposta_faq']:.1%}) | "
+          f"ramos: {', '.join(f'{r} {n}' for r, n in ramos.most_common())}")
+    if perdidas:
+        print(f"com resposta no FAQ, mas desviadas para: {', '.join(f'{r} {n}' for r, n in perdidas.most_common())}")
+    if latencias:
+        lat = resumo["latencia_ms"]
+        print(f"latência da busca: p50 {lat['p50']:.3f} ms | p95 {lat['p95']:.3f} ms | p99 {lat['p99']:.3f} ms")
+    print(f"carga do índice: {carga_ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Micro-benchmark da detecção de termos jurídicos.
+#
+# Compara a varredura antiga (substring de cada termo no texto, uma vez por
+# função) com o IndiceTermos de app.py, crescendo o vocabulário até milhares
+# de termos e o texto até mensagens longas coladas pelo usuário.
+#
+# Uso (a partir de web-container/):
+#   python bench/bench_detector.py
+#   python bench/bench_detector.py --termos 100 1000 5000 --palavras 20 500
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import PALAVRAS_JURIDICAS, IndiceTermos  # noqa: E402
+
+TEXTO_BASE = (
+    "fui demitido sem justa causa e o empregador não pagou as verbas rescisórias "
+    "nem o fgts, além disso errei um pix e o banco não quer fazer o estorno"
+).split()
+
+def vocabulario(total: int, rnd: random.Random) -> dict[str, list[str]]:
+    areas = {area: list(palavras) for area, palavras in PALAVRAS_JURIDICAS.items()}
+    nomes = list(areas)
+    letras = "abcdefghijklmnopqrstuvwxyz"
+    while sum(len(p) for p in areas.values()) < total:
+        palavras = ["".join(rnd.choices(letras, k=rnd.randint(4, 10))) for _ in range(rnd.randint(1, 3))]
+        areas[rnd.choice(nomes)].append(" ".join(palavras))
+    return areas
+
+def texto(palavras: int) -> str:
+    return " ".join(TEXTO_BASE[i % len(TEXTO_BASE)] for i in range(palavras))
+
+# Implementação anterior: eh_tema_juridico + detectar_area, cada uma varrendo tudo
+def varredura_antiga(areas: dict[str, list[str]], pergunta: str) -> str:
+    p = pergunta.lower()
+    if not any(palavra in p for palavras in areas.values() for palavra in palavras):
+        return "Jurídico Geral"
+    melhor_area = "Jurídico Geral"
+    max_count = 0
+    for area, palavras in areas.items():
+        count = sum(1 for palavra in palavras if palavra in p)
+        if count > max_count:
+            max_count = count
+            melhor_area = area
+    return melhor_area
+
+def medir(func, repeticoes: int) -> float:
+    return min(timeit.repeat(func, number=repeticoes, repeat=3)) / repeticoes * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark da detecção de termos")
+    parser.add_argument("--termos", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--palavras", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    print(f"{'termos':>8} {'palavras':>9} {'antigo (µs)':>12} {'índice (µs)':>12} {'ganho':>8}")
+    for total in args.termos:
+        areas = vocabulario(total, rnd)
+        indice = IndiceTermos(areas)
+        for palavras in args.palavras:
+            pergunta = texto(palavras)
+            antigo = medir(lambda: varredura_antiga(areas, pergunta), args.repeticoes)
+            novo = medir(lambda: indice.buscar(pergunta), args.repeticoes)
+            print(f"{total:>8} {palavras:>9} {antigo:>12.1f} {novo:>12.1f} {antigo / novo:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Gerador de carga para o /chat (ou /chat/stream).
+#
+# Várias threads, cada uma com sua sessão keep-alive, sorteiam perguntas do mix
+# em bench/perguntas_carga.json (saudações, temas rápidos, perguntas jurídicas
+# que vão à IA e perguntas fora do tema) de acordo com o peso de cada
+# categoria, e medem a latência de cada resposta. No fim, imprime vazão,
+# p50/p95/p99, taxa de erro e taxa de fallback (a IA falhou e o app respondeu
+# com o encaminhamento ao WhatsApp, ainda com status 200), no total e por
+# categoria.
+#
+# Uso (a partir de web-container/, com o app já rodando):
+#   python bench/carga.py --url http://127.0.0.1:5000 --concorrencia 16 --duracao 30
+#   python bench/carga.py --stream --variar --json resultado.json
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+
+MIX_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perguntas_carga.json")
+
+def percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+# Resposta de fallback: {"fallback": true} no JSON do /chat ou no evento
+# "fim" do /chat/stream
+def eh_fallback(corpo: str, stream: bool) -> bool:
+    if not stream:
+        return bool(json.loads(corpo).get("fallback"))
+    for evento in corpo.split("\n\n"):
+        if evento.startswith("event: fim\n"):
+            return bool(json.loads(evento.split("data: ", 1)[1]).get("fallback"))
+    return False
+
+def resumir(amostras: list[dict], duracao: float) -> dict:
+    latencias = [a["latencia"] for a in amostras if a["ok"]]
+    erros = sum(1 for a in amostras if not a["ok"])
+    fallbacks = sum(1 for a in amostras if a["ok"] and a["fallback"])
+    resumo = {
+        "requisicoes": len(amostras),
+        "erros": erros,
+        "taxa_erro": round(erros / len(amostras), 4) if amostras else 0.0,
+        "fallbacks": fallbacks,
+        "taxa_fallback": round(fallbacks / len(amostras), 4) if amostras else 0.0,
+        "vazao_rps": round(len(amostras) / duracao, 2) if duracao else 0.0,
+        "latencia_ms": {p: round(percentil(latencias, n) * 1000, 2) for p, n in (("p50", 50), ("p95", 95), ("p99", 99))},
+    }
+    primeiros = [a["primeiro_byte"] for a in amostras if a["ok"] and a.get("primeiro_byte") is not None]
+    if primeiros:
+        resumo["primeiro_byte_ms"] = {p: round(percentil(primeiros, n) * 1000, 2) for p, n in (("p50", 50), ("p95", 95), ("p99", 99))}
+    return resumo
+
+def executar(url: str, concorrencia: int, duracao: float, mix: dict, stream: bool = False,
+             variar: bool = False, semente: int = 42, timeout: float = 60.0) -> dict:
+    categorias = list(mix)
+    pesos = [mix[c]["peso"] for c in categorias]
+    rota = f"{url.rstrip('/')}/chat/stream" if stream else f"{url.rstrip('/')}/chat"
+    amostras: list[dict] = []
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def trabalhador(indice: int):
+        rnd = random.Random(semente + indice)
+        sessao = requests.Session()
+        locais = []
+        while time.monotonic() < fim:
+            categoria = rnd.choices(categorias, pesos)[0]
+            pergunta = rnd.choice(mix[categoria]["perguntas"])
+            if variar:
+                # Evita que o cache de respostas responda tudo depois da 1ª vez
+                pergunta = f"{pergunta} (caso {rnd.randint(1, 1_000_000)})"
+            inicio = time.perf_counter()
+            primeiro_byte = None
+            fallback = False
+            try:
+                resp = sessao.post(rota, json={"pergunta": pergunta}, timeout=timeout, stream=stream)
+                if stream:
+                    pedacos = []
+                    for pedaco in resp.iter_content(chunk_size=None):
+                        if primeiro_byte is None:
+                            primeiro_byte = time.perf_counter() - inicio
+                        pedacos.append(pedaco)
+                    corpo = b"".join(pedacos).decode("utf-8")
+                else:
+                    corpo = resp.text
+                ok = resp.status_code == 200
+                fallback = ok and eh_fallback(corpo, stream)
+            except (requests.RequestException, ValueError):
+                ok = False
+            locais.append({"categoria": categoria, "ok": ok, "fallback": fallback,
+                           "latencia": time.perf_counter() - inicio, "primeiro_byte": primeiro_byte})
+        with lock:
+            amostras.extend(locais)
+
+    inicio = time.monotonic()
+    threads = [threading.Thread(target=trabalhador, args=(i,)) for i in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    decorrido = time.monotonic() - inicio
+
+    return {
+        "rota": "/chat/stream" if stream else "/chat",
+        "concorrencia": concorrencia,
+        "duracao_s": round(decorrido, 2),
+        **resumir(amostras, decorrido),
+        "por_categoria": {c: resumir([a for a in amostras if a["categoria"] == c], decorrido) for c in categorias},
+    }
+
+def imprimir(resultado: dict):
+    lat = resultado["latencia_ms"]
+    print(f"{resultado['rota']} concorrência {resultado['concorrencia']}: {resultado['requisicoes']} req em "
+          f"{resultado['duracao_s']} s | {resultado['vazao_rps']} req/s | erros {resultado['taxa_erro']:.2%} | "
+          f"fallback {resultado['taxa_fallback']:.2%} | "
+          f"p50 {lat['p50']} ms p95 {lat['p95']} ms p99 {lat['p99']} ms")
+    if "primeiro_byte_ms" in resultado:
+        pb = resultado["primeiro_byte_ms"]
+        print(f"  primeiro byte: p50 {pb['p50']} ms p95 {pb['p95']} ms p99 {pb['p99']} ms")
+    for categoria, r in resultado["por_categoria"].items():
+        lat = r["latencia_ms"]
+        print(f"  {categoria:<14} {r['requisicoes']:>6} req | erros {r['taxa_erro']:.2%} | "
+              f"fallback {r['taxa_fallback']:.2%} | "
+              f"p50 {lat['p50']} ms p95 {lat['p95']} ms p99 {lat['p99']} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para o /chat")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--duracao", type=float, default=20, help="segundos")
+    parser.add_argument("--mix", default=MIX_PADRAO)
+    parser.add_argument("--stream", action="store_true", help="usa /chat/stream e mede o primeiro byte")
+    parser.add_argument("--variar", action="store_true", help="torna cada pergunta única (sem acertos no cache)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    with open(args.mix, encoding="utf-8") as f:
+        mix = json.load(f)
+    resultado = executar(args.url, args.concorrencia, args.duracao, mix, args.stream, args.variar, args.semente)
+    imprimir(resultado)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
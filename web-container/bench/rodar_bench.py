@@ -0,0 +1,169 @@
+# Bateria de benchmark reprodutível do /chat.
+#
+# Sobe o stub LLM (bench/stub_llm.py) e, para cada combinação de workers,
+# threads e concorrência, sobe o app apontando para o stub, roda o gerador de
+# carga (bench/carga.py) e derruba o app. Com mais de um worker o app roda no
+# gunicorn (pip install gunicorn); com um, no servidor embutido do Flask, que
+# não tem número de threads configurável (os resultados saem com threads=None).
+#
+# Os resultados vão para bench/resultados/<data>-<commit>.json junto com os
+# parâmetros usados, e --comparar mostra a diferença para uma rodada anterior.
+#
+# Uso (a partir de web-container/):
+#   python bench/rodar_bench.py --workers 1 --concorrencia 4 16 --duracao 15
+#   python bench/rodar_bench.py --workers 1 4 --threads 8 --latencia fixa:300 --taxa-erro 0.05
+#   python bench/rodar_bench.py --comparar bench/resultados/2026-01-10-abc1234.json
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import carga  # noqa: E402
+import stub_llm  # noqa: E402
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def commit_atual() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+def subir_app(porta: int, workers: int, threads: int | None, ambiente: dict) -> subprocess.Popen:
+    if workers > 1:
+        if not shutil.which("gunicorn"):
+            sys.exit("Mais de um worker requer o gunicorn (pip install gunicorn)")
+        comando = ["gunicorn", "-w", str(workers), "--threads", str(threads), "-b", f"127.0.0.1:{porta}",
+                   "--log-level", "warning", "app:app"]
+    else:
+        comando = [sys.executable, "app.py"]
+    processo = subprocess.Popen(comando, cwd=APP_DIR, env={**os.environ, **ambiente, "PORT": str(porta)},
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            sys.exit(f"O app terminou ao subir (código {processo.returncode})")
+        try:
+            requests.get(f"http://127.0.0.1:{porta}/", timeout=1)
+            return processo
+        except requests.RequestException:
+            time.sleep(0.2)
+    processo.kill()
+    sys.exit("O app não respondeu em 30 s")
+
+def derrubar(processo: subprocess.Popen):
+    processo.terminate()
+    try:
+        processo.wait(10)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+
+def comparar(atual: dict, anterior: dict):
+    chave = lambda r: (r["workers"], r["threads"], r["concorrencia"], r["rota"])  # noqa: E731
+    antigos = {chave(r): r for r in anterior["resultados"]}
+    print(f"\nComparação com {anterior['meta']['commit']} ({anterior['meta']['data']}):")
+    for r in atual["resultados"]:
+        a = antigos.get(chave(r))
+        if not a:
+            continue
+        delta = lambda novo, velho: f"{(novo - velho) / velho:+.1%}" if velho else "n/a"  # noqa: E731
+        print(f"  w={r['workers']} t={r['threads']} c={r['concorrencia']} {r['rota']}: "
+              f"vazão {a['vazao_rps']} -> {r['vazao_rps']} ({delta(r['vazao_rps'], a['vazao_rps'])}) | "
+              f"p95 {a['latencia_ms']['p95']} -> {r['latencia_ms']['p95']} ms "
+              f"({delta(r['latencia_ms']['p95'], a['latencia_ms']['p95'])}) | "
+              f"erros {a['taxa_erro']:.2%} -> {r['taxa_erro']:.2%} | "
+              f"fallback {a.get('taxa_fallback', 0):.2%} -> {r['taxa_fallback']:.2%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bateria de benchmark do /chat com stub LLM")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--threads", type=int, nargs="+", default=[8], help="threads por worker (gunicorn)")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duracao", type=float, default=15)
+    parser.add_argument("--latencia", default="lognormal:400:0.5", help="distribuição do stub (ver stub_llm.py)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true", help="mede /chat/stream em vez de /chat")
+    parser.add_argument("--variar", action="store_true", help="perguntas únicas (sem acertos no cache)")
+    parser.add_argument("--sem-cache", action="store_true", help="desliga o cache de respostas do app")
+    parser.add_argument("--mix", default=carga.MIX_PADRAO)
+    parser.add_argument("--saida", default=os.path.join(BENCH_DIR, "resultados"))
+    parser.add_argument("--comparar", help="resultado anterior (JSON) para comparar")
+    args = parser.parse_args()
+
+    with open(args.mix, encoding="utf-8") as f:
+        mix = json.load(f)
+
+    porta_stub = porta_livre()
+    stub = stub_llm.iniciar(porta_stub, args.latencia, args.taxa_erro)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    # --threads só vale para o gunicorn; com um worker, roda uma vez só
+    combinacoes = dict.fromkeys(
+        (workers, threads if workers > 1 else None, concorrencia)
+        for workers, threads, concorrencia in itertools.product(args.workers, args.threads, args.concorrencia)
+    )
+    resultados = []
+    for workers, threads, concorrencia in combinacoes:
+        ambiente = {
+            "GROQ_API_KEY": "stub",
+            "LLM_BACKENDS": "groq",
+            "LLM_BASE_URL": f"http://127.0.0.1:{porta_stub}",
+        }
+        if args.sem_cache:
+            ambiente["CACHE_MAX_ITENS"] = "0"
+        with tempfile.TemporaryDirectory() as metricas_dir:
+            if workers > 1:
+                ambiente["METRICAS_DIR"] = metricas_dir
+            porta = porta_livre()
+            app = subir_app(porta, workers, threads, ambiente)
+            try:
+                resultado = carga.executar(f"http://127.0.0.1:{porta}", concorrencia, args.duracao, mix,
+                                           args.stream, args.variar)
+            finally:
+                derrubar(app)
+        resultado.update(workers=workers, threads=threads)
+        print(f"[workers={workers} threads={threads}] ", end="")
+        carga.imprimir(resultado)
+        resultados.append(resultado)
+    stub.shutdown()
+
+    saida = {
+        "meta": {
+            "commit": commit_atual(),
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "parametros": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+        },
+        "resultados": resultados,
+    }
+    os.makedirs(args.saida, exist_ok=True)
+    arquivo = os.path.join(args.saida, f"{datetime.now():%Y-%m-%d-%H%M%S}-{saida['meta']['commit']}.json")
+    with open(arquivo, "w", encoding="utf-8") as f:
+        json.dump(saida, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em {arquivo}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(saida, json.load(f))
+
+if __name__ == "__main__":
+    main()
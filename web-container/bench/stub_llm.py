@@ -0,0 +1,147 @@
+# Servidor LLM falso para testes de carga, sem rede e sem chave de API.
+#
+# Fala o protocolo chat-completions (POST /chat/completions, com ou sem
+# "stream": true) e o /api/generate do Ollama, com latência sorteada de uma
+# distribuição configurável e uma taxa de erros (503) opcional.
+#
+# Uso (a partir de web-container/):
+#   python bench/stub_llm.py --porta 8765 --latencia lognormal:400:0.5 --taxa-erro 0.02
+#   LLM_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=stub python app.py
+#
+# Distribuições de --latencia (valores em ms):
+#   fixa:300            sempre 300 ms
+#   uniforme:100:900    uniforme entre 100 e 900 ms
+#   lognormal:400:0.5   mediana de 400 ms, sigma 0.5 (cauda longa, como APIs reais)
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPOSTA = ("Você tem direito de buscar a reparação e não está sozinho nessa situação. "
+            "Fale agora com um especialista e veja como é possível reverter o seu caso.")
+
+# Devolve uma função que sorteia a latência (em segundos) de cada resposta
+def sorteador_latencia(especificacao: str, rnd: random.Random):
+    tipo, *params = especificacao.split(":")
+    if tipo == "fixa":
+        fixa = float(params[0]) / 1000
+        return lambda: fixa
+    if tipo == "uniforme":
+        minimo, maximo = float(params[0]) / 1000, float(params[1]) / 1000
+        return lambda: rnd.uniform(minimo, maximo)
+    if tipo == "lognormal":
+        mu, sigma = math.log(float(params[0]) / 1000), float(params[1])
+        return lambda: rnd.lognormvariate(mu, sigma)
+    raise ValueError(f"distribuição de latência desconhecida: {especificacao}")
+
+class Contadores:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requisicoes = 0
+        self.erros = 0
+
+def criar_handler(latencia, taxa_erro: float, tokens: int, rnd: random.Random, contadores: Contadores):
+    palavras = RESPOSTA.split(" ")[:tokens]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _enviar(self, status: int, corpo: bytes, tipo: str = "application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _pedaco(self, dados: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(dados), dados))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/estatisticas":
+                with contadores.lock:
+                    corpo = {"requisicoes": contadores.requisicoes, "erros": contadores.erros}
+                self._enviar(200, json.dumps(corpo).encode())
+            else:
+                self._enviar(404, b"{}")
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+            erro = rnd.random() < taxa_erro
+            with contadores.lock:
+                contadores.requisicoes += 1
+                contadores.erros += erro
+            total = latencia()
+            if erro:
+                time.sleep(total / 4)
+                self._enviar(503, b'{"error": "stub: erro simulado"}')
+                return
+
+            ollama = self.path == "/api/generate"
+            if not pedido.get("stream"):
+                time.sleep(total)
+                texto = " ".join(palavras)
+                corpo = {"response": texto, "done": True} if ollama else \
+                    {"choices": [{"message": {"role": "assistant", "content": texto}}]}
+                self._enviar(200, json.dumps(corpo, ensure_ascii=False).encode("utf-8"))
+                return
+
+            # Streaming: primeiro pedaço após ~20% da latência, o resto distribuído
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson" if ollama else "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(total * 0.2)
+            intervalo = total * 0.8 / max(1, len(palavras))
+            for i, palavra in enumerate(palavras):
+                texto = palavra if i == 0 else f" {palavra}"
+                if ollama:
+                    linha = json.dumps({"response": texto, "done": False}, ensure_ascii=False) + "\n"
+                else:
+                    linha = "data: " + json.dumps({"choices": [{"delta": {"content": texto}}]}, ensure_ascii=False) + "\n\n"
+                self._pedaco(linha.encode("utf-8"))
+                time.sleep(intervalo)
+            self._pedaco(b'{"response": "", "done": true}\n' if ollama else b"data: [DONE]\n\n")
+            self._pedaco(b"")
+
+    return Handler
+
+class ServidorStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Conexões keep-alive derrubadas quando o app é encerrado entre rodadas
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def iniciar(porta: int, latencia: str, taxa_erro: float = 0.0, tokens: int = 30, semente: int = 42) -> ThreadingHTTPServer:
+    rnd = random.Random(semente)
+    handler = criar_handler(sorteador_latencia(latencia, rnd), taxa_erro, tokens, rnd, Contadores())
+    return ServidorStub(("127.0.0.1", porta), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor LLM falso para testes de carga")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", default="lognormal:400:0.5")
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=30, help="palavras por resposta")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    servidor = iniciar(args.porta, args.latencia, args.taxa_erro, args.tokens, args.semente)
+    print(f"stub LLM em http://127.0.0.1:{args.porta} (latência {args.latencia}, erros {args.taxa_erro:.0%})", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()